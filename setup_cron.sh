@@ -9,8 +9,8 @@ LOG_DIR="$PROJECT_DIR/logs"
 # Create logs directory if it doesn't exist
 mkdir -p "$LOG_DIR"
 
-# Create the cron command
-CRON_CMD="*/15 * * * * cd $PROJECT_DIR && $PYTHON_PATH src/multi_channel_pipeline.py >> $LOG_DIR/pipeline.log 2>&1"
+# Create the cron command (exports .env up front so the pipeline skips parsing it)
+CRON_CMD="*/15 * * * * cd $PROJECT_DIR && set -a && . ./.env && set +a && $PYTHON_PATH src/multi_channel_pipeline.py >> $LOG_DIR/pipeline.log 2>&1"
 
 echo "======================================================================="
 echo "IoT Pipeline Cron Job Setup"
@@ -66,6 +66,62 @@ BEGIN
 END
 GO
 
+-- SensorReadings_Staging: unindexed heap for bulk loads, de-duplicated into SensorReadings
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'SensorReadings_Staging' AND schema_id = SCHEMA_ID('iot'))
+BEGIN
+    CREATE TABLE iot.SensorReadings_Staging (
+        ChannelID INT NOT NULL,
+        EntryID BIGINT NOT NULL,
+        CreatedAt DATETIME2 NOT NULL,
+        Field1 DECIMAL(18, 6),
+        Field2 DECIMAL(18, 6),
+        Field3 DECIMAL(18, 6),
+        Field4 DECIMAL(18, 6),
+        Field5 DECIMAL(18, 6),
+        Field6 DECIMAL(18, 6),
+        Field7 DECIMAL(18, 6),
+        Field8 DECIMAL(18, 6),
+        Latitude DECIMAL(10, 8),
+        Longitude DECIMAL(11, 8),
+        Elevation DECIMAL(10, 2),
+        Status NVARCHAR(50)
+    );
+END
+GO
+
+-- SensorReadings_Stage_Mem: optional memory-optimized (SCHEMA_ONLY) staging table.
+-- Only created when the server supports In-Memory OLTP and the database has a
+-- MEMORY_OPTIMIZED_DATA filegroup. Enable with DB_MEMORY_OPTIMIZED_STAGING=True.
+IF SERVERPROPERTY('IsXTPSupported') = 1
+    AND EXISTS (SELECT * FROM sys.filegroups WHERE type = 'FX')
+    AND NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'SensorReadings_Stage_Mem' AND schema_id = SCHEMA_ID('iot'))
+BEGIN
+    -- Let READ COMMITTED transactions access memory-optimized tables
+    ALTER DATABASE CURRENT SET MEMORY_OPTIMIZED_ELEVATE_TO_SNAPSHOT = ON;
+    
+    EXEC('
+        CREATE TABLE iot.SensorReadings_Stage_Mem (
+            ChannelID INT NOT NULL,
+            EntryID BIGINT NOT NULL,
+            CreatedAt DATETIME2 NOT NULL,
+            Field1 DECIMAL(18, 6),
+            Field2 DECIMAL(18, 6),
+            Field3 DECIMAL(18, 6),
+            Field4 DECIMAL(18, 6),
+            Field5 DECIMAL(18, 6),
+            Field6 DECIMAL(18, 6),
+            Field7 DECIMAL(18, 6),
+            Field8 DECIMAL(18, 6),
+            Latitude DECIMAL(10, 8),
+            Longitude DECIMAL(11, 8),
+            Elevation DECIMAL(10, 2),
+            Status NVARCHAR(50),
+            INDEX IX_SensorReadings_Stage_Mem_ChannelID NONCLUSTERED (ChannelID)
+        ) WITH (MEMORY_OPTIMIZED = ON, DURABILITY = SCHEMA_ONLY)
+    ');
+END
+GO
+
 -- Create indexes for better query performance
 IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_SensorReadings_ChannelID_CreatedAt')
 BEGIN
@@ -142,4 +198,26 @@ BEGIN
 END
 GO
 
+-- SensorReadingTVP: table type for passing a batch of feed entries to stored procedures
+IF NOT EXISTS (SELECT * FROM sys.types WHERE name = 'SensorReadingTVP' AND schema_id = SCHEMA_ID('iot'))
+BEGIN
+    CREATE TYPE iot.SensorReadingTVP AS TABLE (
+        EntryID BIGINT NOT NULL,
+        CreatedAt DATETIME2 NOT NULL,
+        Field1 DECIMAL(18, 6),
+        Field2 DECIMAL(18, 6),
+        Field3 DECIMAL(18, 6),
+        Field4 DECIMAL(18, 6),
+        Field5 DECIMAL(18, 6),
+        Field6 DECIMAL(18, 6),
+        Field7 DECIMAL(18, 6),
+        Field8 DECIMAL(18, 6),
+        Latitude DECIMAL(10, 8),
+        Longitude DECIMAL(11, 8),
+        Elevation DECIMAL(10, 2),
+        Status NVARCHAR(50)
+    );
+END
+GO
+
 PRINT 'Database schema created successfully!';
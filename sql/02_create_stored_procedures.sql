@@ -354,4 +354,161 @@ BEGIN
 END
 GO
 
+-- =============================================
+-- Stored Procedure: usp_IngestChannelBatch
+-- Description: Inserts a batch of new readings for a channel and, unless
+--              @RunAggregations = 0, refreshes its HOURLY and DAILY
+--              aggregations in the same call
+-- =============================================
+CREATE OR ALTER PROCEDURE iot.usp_IngestChannelBatch
+    @ChannelID INT,
+    @Feeds iot.SensorReadingTVP READONLY,
+    @RunAggregations BIT = 1
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    
+    DECLARE @InsertedCount INT;
+    
+    -- Insert only entries not already stored
+    INSERT INTO iot.SensorReadings
+        (ChannelID, EntryID, CreatedAt, Field1, Field2, Field3, Field4,
+         Field5, Field6, Field7, Field8, Latitude, Longitude, Elevation, Status)
+    SELECT @ChannelID, f.EntryID, f.CreatedAt, f.Field1, f.Field2, f.Field3, f.Field4,
+           f.Field5, f.Field6, f.Field7, f.Field8, f.Latitude, f.Longitude, f.Elevation, f.Status
+    FROM @Feeds f
+    WHERE NOT EXISTS (
+        SELECT 1 FROM iot.SensorReadings r
+        WHERE r.ChannelID = @ChannelID AND r.EntryID = f.EntryID
+    );
+    
+    SET @InsertedCount = @@ROWCOUNT;
+    
+    IF @RunAggregations = 1
+    BEGIN
+        EXEC iot.usp_ProcessSensorReadings @ChannelID, 'HOURLY', NULL, NULL;
+        EXEC iot.usp_ProcessSensorReadings @ChannelID, 'DAILY', NULL, NULL;
+    END
+    
+    SELECT @InsertedCount AS InsertedCount;
+    
+    RETURN 0;
+END
+GO
+
+-- =============================================
+-- Stored Procedure: usp_MergeStaging
+-- Description: Merges a channel's staged readings into SensorReadings,
+--              skipping entries already stored or staged more than once,
+--              then clears them from staging
+-- =============================================
+CREATE OR ALTER PROCEDURE iot.usp_MergeStaging
+    @ChannelID INT,
+    @MemoryOptimized BIT = 0
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    
+    DECLARE @InsertedCount INT;
+    
+    IF @MemoryOptimized = 1
+    BEGIN
+        MERGE iot.SensorReadings AS target
+        USING (
+            -- An entry staged twice (e.g. left over from a failed load) must
+            -- reach the MERGE once, or its second copy violates UQ_ChannelEntry
+            SELECT ChannelID, EntryID, CreatedAt, Field1, Field2, Field3, Field4,
+                   Field5, Field6, Field7, Field8, Latitude, Longitude, Elevation, Status
+            FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY ChannelID, EntryID
+                                             ORDER BY CreatedAt) AS StagedCopy
+                FROM iot.SensorReadings_Stage_Mem
+                WHERE ChannelID = @ChannelID
+            ) AS staged
+            WHERE StagedCopy = 1
+        ) AS source
+        ON target.ChannelID = source.ChannelID AND target.EntryID = source.EntryID
+        WHEN NOT MATCHED BY TARGET THEN
+            INSERT (ChannelID, EntryID, CreatedAt, Field1, Field2, Field3, Field4,
+                    Field5, Field6, Field7, Field8, Latitude, Longitude, Elevation, Status)
+            VALUES (source.ChannelID, source.EntryID, source.CreatedAt,
+                    source.Field1, source.Field2, source.Field3, source.Field4,
+                    source.Field5, source.Field6, source.Field7, source.Field8,
+                    source.Latitude, source.Longitude, source.Elevation, source.Status);
+        
+        SET @InsertedCount = @@ROWCOUNT;
+        
+        -- Only clear this channel's rows so concurrent loads are left intact
+        DELETE FROM iot.SensorReadings_Stage_Mem WHERE ChannelID = @ChannelID;
+    END
+    ELSE
+    BEGIN
+        MERGE iot.SensorReadings AS target
+        USING (
+            -- An entry staged twice (e.g. left over from a failed load) must
+            -- reach the MERGE once, or its second copy violates UQ_ChannelEntry
+            SELECT ChannelID, EntryID, CreatedAt, Field1, Field2, Field3, Field4,
+                   Field5, Field6, Field7, Field8, Latitude, Longitude, Elevation, Status
+            FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY ChannelID, EntryID
+                                             ORDER BY CreatedAt) AS StagedCopy
+                FROM iot.SensorReadings_Staging
+                WHERE ChannelID = @ChannelID
+            ) AS staged
+            WHERE StagedCopy = 1
+        ) AS source
+        ON target.ChannelID = source.ChannelID AND target.EntryID = source.EntryID
+        WHEN NOT MATCHED BY TARGET THEN
+            INSERT (ChannelID, EntryID, CreatedAt, Field1, Field2, Field3, Field4,
+                    Field5, Field6, Field7, Field8, Latitude, Longitude, Elevation, Status)
+            VALUES (source.ChannelID, source.EntryID, source.CreatedAt,
+                    source.Field1, source.Field2, source.Field3, source.Field4,
+                    source.Field5, source.Field6, source.Field7, source.Field8,
+                    source.Latitude, source.Longitude, source.Elevation, source.Status);
+        
+        SET @InsertedCount = @@ROWCOUNT;
+        
+        -- Only clear this channel's rows so concurrent loads are left intact
+        DELETE FROM iot.SensorReadings_Staging WHERE ChannelID = @ChannelID;
+    END
+    
+    SELECT @InsertedCount AS InsertedCount;
+    
+    RETURN 0;
+END
+GO
+
+-- =============================================
+-- Stored Procedure: usp_RunPostIngest
+-- Description: Runs a channel's post-ingest processing (HOURLY and DAILY
+--              aggregations and the data quality check) in one call and
+--              returns the data quality metrics when they are calculated
+-- =============================================
+CREATE OR ALTER PROCEDURE iot.usp_RunPostIngest
+    @ChannelID INT,
+    @RunHourly BIT = 1,
+    @RunDaily BIT = 1,
+    @RunQuality BIT = 1
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    
+    -- Aggregations MERGE on (ChannelID, AggregationType, PeriodStart), so
+    -- running them back to back (or re-running them) is safe
+    IF @RunHourly = 1
+        EXEC iot.usp_ProcessSensorReadings @ChannelID, 'HOURLY', NULL, NULL;
+    
+    IF @RunDaily = 1
+        EXEC iot.usp_ProcessSensorReadings @ChannelID, 'DAILY', NULL, NULL;
+    
+    IF @RunQuality = 1
+        EXEC iot.usp_CalculateDataQuality @ChannelID, NULL;
+    
+    RETURN 0;
+END
+GO
+
 PRINT 'Stored procedures created successfully!';
@@ -2,20 +2,150 @@
 Database Connection and Operations Module
 Handles MS SQL Server connections and operations
 """
-import pyodbc
 import logging
-from typing import Optional, List, Dict, Any
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import chain, islice
+from queue import Queue
+from typing import Optional, List, Dict, Any, Iterable, Iterator, Sized, Tuple
 from datetime import datetime
+from decimal import Decimal
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# pyodbc loads the native ODBC driver manager, so it is imported on the first
+# connect() rather than at module import
+pyodbc = None
+
+# SQL Server rejects requests with 2100 or more bound parameters
+MAX_PARAMETERS_PER_STATEMENT = 2099
+
+# Rows buffered per parameter-array executemany when streaming large loads
+STREAM_CHUNK_ROWS = 1000
+
+# Numeric feed keys in SensorReadings column order (Field1-Field8, Latitude, Longitude, Elevation)
+NUMERIC_FEED_KEYS = tuple(f'field{i}' for i in range(1, 9)) + ('latitude', 'longitude', 'elevation')
+
+
+def _chunks(rows: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    """Yield successive lists of at most size rows without materializing the input"""
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+@lru_cache(maxsize=16)
+def _placeholders(count: int) -> str:
+    """Comma-separated parameter markers for a statement with count parameters"""
+    return ', '.join(['?'] * count)
+
+
+@lru_cache(maxsize=64)
+def _exec_statement(proc_name: str, param_count: int) -> str:
+    """EXEC statement for a stored procedure taking param_count parameters"""
+    if param_count:
+        return f"EXEC {proc_name} {_placeholders(param_count)}"
+    return f"EXEC {proc_name}"
+
+
+@lru_cache(maxsize=512)
+def _format_sql(template: str, table: str = '', row_count: int = 0, column_count: int = 0) -> str:
+    """
+    Complete a SQL template with a table name and/or row_count VALUES rows
+    
+    Cached so repeated calls return the same string object.
+    """
+    values = ', '.join([f"({_placeholders(column_count)})"] * row_count)
+    return template.format(table=table, values=values)
+
 
 class DatabaseConnection:
     """Manages MS SQL Server database connections and operations"""
     
+    # Static SQL is built once here so every call passes pyodbc the identical
+    # string. {values} and {table} are completed (and cached) by _format_sql.
+    _SQL_UPSERT_CHANNELS = """
+        MERGE iot.Channels AS target
+        USING (VALUES {values}) AS source
+            (ChannelID, ChannelName, Description, Latitude, Longitude,
+             Field1Name, Field2Name, Field3Name, Field4Name,
+             Field5Name, Field6Name, Field7Name, Field8Name)
+        ON target.ChannelID = source.ChannelID
+        WHEN MATCHED THEN
+            UPDATE SET 
+                ChannelName = source.ChannelName,
+                Description = source.Description,
+                Latitude = source.Latitude,
+                Longitude = source.Longitude,
+                Field1Name = source.Field1Name,
+                Field2Name = source.Field2Name,
+                Field3Name = source.Field3Name,
+                Field4Name = source.Field4Name,
+                Field5Name = source.Field5Name,
+                Field6Name = source.Field6Name,
+                Field7Name = source.Field7Name,
+                Field8Name = source.Field8Name,
+                UpdatedAt = GETUTCDATE()
+        WHEN NOT MATCHED THEN
+            INSERT (ChannelID, ChannelName, Description, Latitude, Longitude,
+                    Field1Name, Field2Name, Field3Name, Field4Name,
+                    Field5Name, Field6Name, Field7Name, Field8Name)
+            VALUES (source.ChannelID, source.ChannelName, source.Description,
+                    source.Latitude, source.Longitude,
+                    source.Field1Name, source.Field2Name, source.Field3Name, source.Field4Name,
+                    source.Field5Name, source.Field6Name, source.Field7Name, source.Field8Name);
+    """
+    
+    _SQL_MERGE_READINGS = """
+        MERGE iot.SensorReadings AS target
+        USING (VALUES {values}) AS source
+            (ChannelID, EntryID, CreatedAt, Field1, Field2, Field3, Field4,
+             Field5, Field6, Field7, Field8, Latitude, Longitude, Elevation, Status)
+        ON target.ChannelID = source.ChannelID AND target.EntryID = source.EntryID
+        WHEN NOT MATCHED THEN
+            INSERT (ChannelID, EntryID, CreatedAt, Field1, Field2, Field3, Field4,
+                    Field5, Field6, Field7, Field8, Latitude, Longitude, Elevation, Status)
+            VALUES (source.ChannelID, source.EntryID, source.CreatedAt,
+                    source.Field1, source.Field2, source.Field3, source.Field4,
+                    source.Field5, source.Field6, source.Field7, source.Field8,
+                    source.Latitude, source.Longitude, source.Elevation, source.Status);
+    """
+    
+    _SQL_INSERT_READINGS = """
+        INSERT INTO {table}
+        (ChannelID, EntryID, CreatedAt, Field1, Field2, Field3, Field4,
+         Field5, Field6, Field7, Field8, Latitude, Longitude, Elevation, Status)
+        VALUES {values}
+    """
+    
+    _SQL_MERGE_STAGED_READINGS = "{CALL iot.usp_MergeStaging (?, ?)}"
+    
+    _SQL_CLEAR_STAGED_READINGS = "DELETE FROM {table} WHERE ChannelID = ?"
+    
+    _SQL_LAST_ENTRIES = """
+        SELECT r.ChannelID, MAX(r.EntryID), MAX(r.CreatedAt)
+        FROM iot.SensorReadings r
+        JOIN (VALUES {values}) AS c (ChannelID) ON r.ChannelID = c.ChannelID
+        GROUP BY r.ChannelID
+    """
+    
+    _SQL_INGEST_CHANNEL_BATCH = "{CALL iot.usp_IngestChannelBatch (?, ?, ?)}"
+    
     def __init__(self, server: str, database: str, username: str = None, password: str = None,
-                 driver: str = "ODBC Driver 17 for SQL Server", trusted_connection: bool = False):
+                 driver: str = "ODBC Driver 18 for SQL Server", trusted_connection: bool = False,
+                 fast_executemany: bool = True, bulk_threshold: int = 1000,
+                 memory_optimized_staging: bool = False, encrypt: bool = True,
+                 trust_server_certificate: bool = False):
         """
         Initialize database connection
         
@@ -26,6 +156,17 @@ class DatabaseConnection:
             password: Database password (optional if using trusted connection)
             driver: ODBC driver name
             trusted_connection: Use Windows authentication
+            fast_executemany: Send batches as ODBC parameter arrays. Disable for
+                drivers without parameter array support (e.g. FreeTDS) to fall
+                back to multi-row INSERT statements.
+            bulk_threshold: Batches at least this large are loaded through the
+                iot.SensorReadings_Staging heap and de-duplicated server-side
+            memory_optimized_staging: Stage bulk loads in the memory-optimized
+                iot.SensorReadings_Stage_Mem table instead, avoiding log writes
+                and page latches on the staging insert
+            encrypt: Encrypt the connection with TLS (Encrypt=yes)
+            trust_server_certificate: Skip server certificate validation, e.g. for
+                self-signed certificates on a trusted network
         """
         self.server = server
         self.database = database
@@ -33,7 +174,20 @@ class DatabaseConnection:
         self.password = password
         self.driver = driver
         self.trusted_connection = trusted_connection
+        self.encrypt = encrypt
+        self.trust_server_certificate = trust_server_certificate
+        self.fast_executemany = fast_executemany
+        self.bulk_threshold = bulk_threshold
+        self.memory_optimized_staging = memory_optimized_staging
+        self.staging_table = ('iot.SensorReadings_Stage_Mem' if memory_optimized_staging
+                              else 'iot.SensorReadings_Staging')
         self.connection = None
+        # Cursors reused per SQL string so pyodbc can skip re-preparing them
+        self._cursors = {}
+        # Set inside transaction() so individual operations leave the commit to it
+        self._defer_commit = False
+        # Set when a deferred commit is owed, so read-only blocks skip the commit
+        self._commit_pending = False
         
     def connect(self) -> bool:
         """
@@ -42,6 +196,9 @@ class DatabaseConnection:
         Returns:
             True if connection successful, False otherwise
         """
+        global pyodbc
+        import pyodbc
+        
         try:
             if self.trusted_connection:
                 conn_str = (
@@ -58,8 +215,13 @@ class DatabaseConnection:
                     f"UID={self.username};"
                     f"PWD={self.password};"
                 )
+            conn_str += (
+                f"Encrypt={'yes' if self.encrypt else 'no'};"
+                f"TrustServerCertificate={'yes' if self.trust_server_certificate else 'no'};"
+            )
             
-            self.connection = pyodbc.connect(conn_str)
+            self.connection = pyodbc.connect(conn_str, autocommit=False)
+            self._cursors = {}
             logger.info(f"Successfully connected to database {self.database} on {self.server}")
             return True
         except pyodbc.Error as e:
@@ -69,9 +231,76 @@ class DatabaseConnection:
     def disconnect(self):
         """Close database connection"""
         if self.connection:
+            for cursor in self._cursors.values():
+                cursor.close()
+            self._cursors = {}
             self.connection.close()
             logger.info("Database connection closed")
             
+    def _commit(self):
+        """Commit the current transaction unless a transaction() block owns it"""
+        if self._defer_commit:
+            self._commit_pending = True
+        else:
+            self.connection.commit()
+            
+    @contextmanager
+    def transaction(self) -> Iterator['DatabaseConnection']:
+        """
+        Group several operations into a single commit
+        
+        Operations inside the block skip their own commit; the block commits
+        once on exit, or rolls back if it raises. A block in which nothing was
+        written skips the commit round-trip. An operation that fails inside
+        the block raises its pyodbc.Error instead of rolling back and
+        returning a failure value, so the block never carries on after its
+        earlier writes were discarded.
+        """
+        self._defer_commit = True
+        self._commit_pending = False
+        try:
+            yield self
+            if self._commit_pending:
+                self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            self._defer_commit = False
+            self._commit_pending = False
+            
+    def _cursor(self, sql: str):
+        """
+        Get the cursor dedicated to a statement, creating it on first use
+        
+        pyodbc only reuses a prepared statement when the same cursor executes
+        the identical SQL string again, so each static statement keeps its own
+        cursor for the lifetime of the connection.
+        """
+        cursor = self._cursors.get(sql)
+        if cursor is None:
+            cursor = self.connection.cursor()
+            self._cursors[sql] = cursor
+        return cursor
+        
+    @contextmanager
+    def _chunk_cursor(self, sql: str, full_chunk: bool) -> Iterator:
+        """
+        Get a cursor for one chunk of a statement sized by its row count
+        
+        Only the full-chunk statement recurs, so only it keeps a cached
+        cursor. The final partial chunk's SQL differs with every row count and
+        runs on a throwaway cursor, keeping open statement handles bounded.
+        """
+        if full_chunk:
+            yield self._cursor(sql)
+            return
+        cursor = self.connection.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+            
     def upsert_channel(self, channel_data: Dict) -> bool:
         """
         Insert or update channel information
@@ -79,6 +308,18 @@ class DatabaseConnection:
         Args:
             channel_data: Dictionary containing channel information
             
+        Returns:
+            True if successful, False otherwise
+        """
+        return self.upsert_channels([channel_data])
+        
+    def upsert_channels(self, channel_data_list: List[Dict]) -> bool:
+        """
+        Insert or update information for several channels in one MERGE
+        
+        Args:
+            channel_data_list: List of dictionaries containing channel information
+            
         Returns:
             True if successful, False otherwise
         """
@@ -86,81 +327,86 @@ class DatabaseConnection:
             logger.error("No database connection")
             return False
             
-        try:
-            cursor = self.connection.cursor()
+        if not channel_data_list:
+            return True
             
-            sql = """
-                MERGE iot.Channels AS target
-                USING (SELECT ? AS ChannelID) AS source
-                ON target.ChannelID = source.ChannelID
-                WHEN MATCHED THEN
-                    UPDATE SET 
-                        ChannelName = ?,
-                        Description = ?,
-                        Latitude = ?,
-                        Longitude = ?,
-                        Field1Name = ?,
-                        Field2Name = ?,
-                        Field3Name = ?,
-                        Field4Name = ?,
-                        Field5Name = ?,
-                        Field6Name = ?,
-                        Field7Name = ?,
-                        Field8Name = ?,
-                        UpdatedAt = GETUTCDATE()
-                WHEN NOT MATCHED THEN
-                    INSERT (ChannelID, ChannelName, Description, Latitude, Longitude,
-                            Field1Name, Field2Name, Field3Name, Field4Name,
-                            Field5Name, Field6Name, Field7Name, Field8Name)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-            """
-            
-            params = (
-                channel_data.get('id'),
-                channel_data.get('name'),
-                channel_data.get('description'),
-                channel_data.get('latitude'),
-                channel_data.get('longitude'),
-                channel_data.get('field1'),
-                channel_data.get('field2'),
-                channel_data.get('field3'),
-                channel_data.get('field4'),
-                channel_data.get('field5'),
-                channel_data.get('field6'),
-                channel_data.get('field7'),
-                channel_data.get('field8'),
-                # Repeat for INSERT
-                channel_data.get('id'),
-                channel_data.get('name'),
-                channel_data.get('description'),
-                channel_data.get('latitude'),
-                channel_data.get('longitude'),
-                channel_data.get('field1'),
-                channel_data.get('field2'),
-                channel_data.get('field3'),
-                channel_data.get('field4'),
-                channel_data.get('field5'),
-                channel_data.get('field6'),
-                channel_data.get('field7'),
-                channel_data.get('field8'),
-            )
+        try:
+            chunk_rows = MAX_PARAMETERS_PER_STATEMENT // 13
+            for chunk in _chunks(channel_data_list, chunk_rows):
+                sql = _format_sql(self._SQL_UPSERT_CHANNELS, row_count=len(chunk), column_count=13)
+                
+                params = []
+                for channel_data in chunk:
+                    params.extend((
+                        channel_data.get('id'),
+                        channel_data.get('name'),
+                        channel_data.get('description'),
+                        channel_data.get('latitude'),
+                        channel_data.get('longitude'),
+                        channel_data.get('field1'),
+                        channel_data.get('field2'),
+                        channel_data.get('field3'),
+                        channel_data.get('field4'),
+                        channel_data.get('field5'),
+                        channel_data.get('field6'),
+                        channel_data.get('field7'),
+                        channel_data.get('field8'),
+                    ))
+                
+                with self._chunk_cursor(sql, len(chunk) == chunk_rows) as cursor:
+                    cursor.execute(sql, params)
             
-            cursor.execute(sql, params)
-            self.connection.commit()
-            logger.info(f"Channel {channel_data.get('id')} upserted successfully")
+            self._commit()
+            channel_ids = ', '.join(str(channel_data.get('id')) for channel_data in channel_data_list)
+            logger.info(f"Channel(s) {channel_ids} upserted successfully")
             return True
         except pyodbc.Error as e:
-            logger.error(f"Error upserting channel: {e}")
+            logger.error(f"Error upserting channels: {e}")
+            if self._defer_commit:
+                raise
             self.connection.rollback()
             return False
             
-    def insert_sensor_readings(self, channel_id: int, feeds: List[Dict]) -> int:
+    def get_last_entries(self, channel_ids: List[int]) -> Dict[int, Tuple[int, datetime]]:
+        """
+        Get the newest stored entry for each channel, used as the watermark
+        for incremental feed fetches
+        
+        Args:
+            channel_ids: Channel IDs to look up
+            
+        Returns:
+            Dictionary mapping channel ID to (last EntryID, last CreatedAt).
+            Channels without stored readings are omitted.
+        """
+        if not self.connection:
+            logger.error("No database connection")
+            return {}
+            
+        last_entries = {}
+        try:
+            for chunk in _chunks(channel_ids, MAX_PARAMETERS_PER_STATEMENT):
+                sql = _format_sql(self._SQL_LAST_ENTRIES, row_count=len(chunk), column_count=1)
+                with self._chunk_cursor(sql, len(chunk) == MAX_PARAMETERS_PER_STATEMENT) as cursor:
+                    cursor.execute(sql, chunk)
+                    for channel_id, entry_id, created_at in cursor.fetchall():
+                        last_entries[channel_id] = (entry_id, created_at)
+            return last_entries
+        except pyodbc.Error as e:
+            logger.error(f"Error reading last entries: {e}")
+            return {}
+            
+    def insert_sensor_readings(self, channel_id: int, feeds: Iterable[Dict]) -> int:
         """
         Insert sensor readings in batch
         
+        Feeds are converted to parameter rows lazily and sent in chunks, so a
+        generator of feed entries is streamed without building a full list.
+        
         Args:
             channel_id: Channel ID
-            feeds: List of feed entries
+            feeds: List or other iterable of feed entries. Iterables without a
+                length are always loaded through the staging table.
             
         Returns:
             Number of records inserted
@@ -169,51 +415,288 @@ class DatabaseConnection:
             logger.error("No database connection")
             return 0
             
+        if isinstance(feeds, Sized) and not feeds:
+            return 0
+            
         try:
-            cursor = self.connection.cursor()
-            inserted_count = 0
-            
-            sql = """
-                INSERT INTO iot.SensorReadings 
-                (ChannelID, EntryID, CreatedAt, Field1, Field2, Field3, Field4,
-                 Field5, Field6, Field7, Field8, Latitude, Longitude, Elevation, Status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
-            
-            for feed in feeds:
-                try:
-                    params = (
-                        channel_id,
-                        feed.get('entry_id'),
-                        feed.get('created_at'),
-                        self._safe_float(feed.get('field1')),
-                        self._safe_float(feed.get('field2')),
-                        self._safe_float(feed.get('field3')),
-                        self._safe_float(feed.get('field4')),
-                        self._safe_float(feed.get('field5')),
-                        self._safe_float(feed.get('field6')),
-                        self._safe_float(feed.get('field7')),
-                        self._safe_float(feed.get('field8')),
-                        self._safe_float(feed.get('latitude')),
-                        self._safe_float(feed.get('longitude')),
-                        self._safe_float(feed.get('elevation')),
-                        feed.get('status')
-                    )
-                    
-                    cursor.execute(sql, params)
-                    inserted_count += 1
-                except pyodbc.IntegrityError:
-                    # Skip duplicate entries
-                    continue
+            param_rows = self._iter_reading_rows(channel_id, feeds)
             
-            self.connection.commit()
+            if isinstance(feeds, Sized) and len(feeds) < self.bulk_threshold:
+                inserted_count = self._merge_reading_rows(param_rows)
+            else:
+                inserted_count = self._insert_via_staging(channel_id, param_rows)
+            
+            self._commit()
             logger.info(f"Inserted {inserted_count} sensor readings for channel {channel_id}")
             return inserted_count
         except pyodbc.Error as e:
             logger.error(f"Error inserting sensor readings: {e}")
+            if self._defer_commit:
+                raise
             self.connection.rollback()
             return 0
             
+    def ingest_channel_batch(self, channel_id: int, feeds: List[Dict],
+                             run_aggregations: bool = True) -> int:
+        """
+        Insert sensor readings and refresh HOURLY/DAILY aggregations in a
+        single stored procedure call and transaction
+        
+        Readings are passed as an iot.SensorReadingTVP table-valued parameter
+        to iot.usp_IngestChannelBatch.
+        
+        Args:
+            channel_id: Channel ID
+            feeds: List of feed entries
+            run_aggregations: Refresh aggregations in the same call. Disable when
+                the caller batches aggregations for many channels afterwards.
+            
+        Returns:
+            Number of records inserted, or -1 if error
+        """
+        if not self.connection:
+            logger.error("No database connection")
+            return -1
+            
+        if not feeds:
+            return 0
+            
+        try:
+            # pyodbc takes a TVP as a list whose first two items name the
+            # table type and its schema, followed by the rows
+            tvp_rows = (row[1:] for row in self._iter_reading_rows(channel_id, feeds))
+            tvp = ["SensorReadingTVP", "iot", *tvp_rows]
+            cursor = self._cursor(self._SQL_INGEST_CHANNEL_BATCH)
+            cursor.execute(self._SQL_INGEST_CHANNEL_BATCH, (channel_id, tvp, run_aggregations))
+            inserted_count = cursor.fetchone()[0]
+            # Drain the procedure's remaining results so the cached cursor
+            # does not leave the connection busy for the next statement
+            while cursor.nextset():
+                pass
+            
+            self._commit()
+            logger.info(f"Ingested {inserted_count} sensor readings for channel {channel_id}")
+            return inserted_count
+        except pyodbc.Error as e:
+            logger.error(f"Error ingesting sensor readings for channel {channel_id}: {e}")
+            if self._defer_commit:
+                raise
+            self.connection.rollback()
+            return -1
+            
+    def _iter_reading_rows(self, channel_id: int, feeds: Iterable[Dict]) -> Iterator[tuple]:
+        """Lazily convert feed entries to parameter tuples in SensorReadings column order"""
+        # Local aliases keep attribute lookups out of the per-row loop
+        to_float = self._safe_float
+        numeric_keys = NUMERIC_FEED_KEYS
+        return (
+            (
+                channel_id,
+                feed.get('entry_id'),
+                feed.get('created_at'),
+                *map(to_float, map(feed.get, numeric_keys)),
+                feed.get('status')
+            )
+            for feed in feeds
+        )
+        
+    def _merge_reading_rows(self, rows: Iterable[tuple]) -> int:
+        """
+        Insert rows whose (ChannelID, EntryID) is not already stored, letting
+        SQL Server filter duplicates with a MERGE over a multi-row VALUES source
+        
+        Args:
+            rows: Parameter tuples in SensorReadings column order
+            
+        Returns:
+            Number of records inserted
+        """
+        inserted_count = 0
+        
+        chunk_rows = MAX_PARAMETERS_PER_STATEMENT // 15
+        for chunk in _chunks(rows, chunk_rows):
+            sql = _format_sql(self._SQL_MERGE_READINGS, row_count=len(chunk), column_count=15)
+            with self._chunk_cursor(sql, len(chunk) == chunk_rows) as cursor:
+                cursor.execute(sql, list(chain.from_iterable(chunk)))
+                inserted_count += cursor.rowcount
+        
+        return inserted_count
+        
+    def _insert_via_staging(self, channel_id: int, rows: Iterable[tuple]) -> int:
+        """
+        Load rows into the staging table, then merge new entries into
+        iot.SensorReadings with a single set-based MERGE
+        
+        Args:
+            channel_id: Channel ID the rows belong to
+            rows: Parameter tuples in SensorReadings column order
+            
+        Returns:
+            Number of records inserted
+        """
+        # bcp commits outside this connection's transaction, so a failed bulk
+        # load can leave the channel's rows behind; clear them before staging
+        sql = _format_sql(self._SQL_CLEAR_STAGED_READINGS, table=self.staging_table)
+        self._cursor(sql).execute(sql, channel_id)
+        
+        self._insert_reading_rows(rows, table=self.staging_table)
+        return self._move_staged_readings(channel_id)
+        
+    def _move_staged_readings(self, channel_id: int) -> int:
+        """
+        Merge a channel's staged entries into iot.SensorReadings and clear
+        its rows from the staging table (iot.usp_MergeStaging)
+        
+        Args:
+            channel_id: Channel ID whose staged rows are moved
+            
+        Returns:
+            Number of records inserted
+        """
+        cursor = self._cursor(self._SQL_MERGE_STAGED_READINGS)
+        cursor.execute(self._SQL_MERGE_STAGED_READINGS, (channel_id, self.memory_optimized_staging))
+        inserted_count = cursor.fetchone()[0]
+        while cursor.nextset():
+            pass
+        return inserted_count
+        
+    def bulk_insert_sensor_readings(self, channel_id: int, feeds: List[Dict]) -> int:
+        """
+        Insert a large batch of sensor readings with the bcp bulk-copy utility
+        
+        Readings are written to a temporary UTF-16 data file, bulk-copied into
+        the staging table over the native TDS bulk-load protocol, then moved
+        into iot.SensorReadings like any other staged load. bcp authenticates
+        with the trusted connection (-T). Falls back to insert_sensor_readings
+        when bcp is not on PATH, the connection uses a SQL login, or the copy
+        fails.
+        
+        Stale staged rows are not deleted up front here: an uncommitted DELETE
+        on this connection could lock out bcp's own session. usp_MergeStaging
+        merges each staged entry once and clears the channel's rows afterwards.
+        
+        Args:
+            channel_id: Channel ID
+            feeds: List of feed entries
+            
+        Returns:
+            Number of records inserted
+        """
+        if not self.connection:
+            logger.error("No database connection")
+            return 0
+            
+        if not feeds:
+            return 0
+            
+        bcp_path = shutil.which('bcp')
+        if not bcp_path:
+            logger.warning("bcp utility not found, falling back to batched inserts")
+            return self.insert_sensor_readings(channel_id, feeds)
+            
+        # bcp only takes a SQL login password as -P on its command line, where
+        # other users can read it from the process list
+        if not self.trusted_connection:
+            logger.warning("bcp requires a trusted connection, falling back to batched inserts")
+            return self.insert_sensor_readings(channel_id, feeds)
+            
+        with tempfile.NamedTemporaryFile('w', encoding='utf-16-le', newline='',
+                                         suffix='.dat', delete=False) as data_file:
+            self._write_bcp_rows(data_file, self._iter_reading_rows(channel_id, feeds))
+        error_path = os.path.splitext(data_file.name)[0] + '.err'
+            
+        try:
+            result = subprocess.run(self._bcp_command(bcp_path, data_file.name, error_path),
+                                    capture_output=True, text=True)
+            # bcp exits 0 even when it rejected rows, so check its error file too
+            rejected = os.path.exists(error_path) and os.path.getsize(error_path) > 0
+        finally:
+            os.remove(data_file.name)
+            if os.path.exists(error_path):
+                os.remove(error_path)
+            
+        if result.returncode != 0 or rejected:
+            logger.error(f"bcp failed for channel {channel_id}, falling back to batched inserts: "
+                         f"{result.stdout.strip() or result.stderr.strip()}")
+            return self.insert_sensor_readings(channel_id, feeds)
+            
+        try:
+            inserted_count = self._move_staged_readings(channel_id)
+            
+            self._commit()
+            logger.info(f"Bulk inserted {inserted_count} sensor readings for channel {channel_id}")
+            return inserted_count
+        except pyodbc.Error as e:
+            logger.error(f"Error moving bulk-loaded sensor readings: {e}")
+            if self._defer_commit:
+                raise
+            self.connection.rollback()
+            return 0
+            
+    def _bcp_command(self, bcp_path: str, data_path: str, error_path: str) -> List[str]:
+        """
+        Build the bcp command line loading data_path into the staging table
+        
+        -m 1 cancels the copy on the first rejected row, and rejected rows are
+        written to error_path, so a partial load is never reported as success.
+        """
+        command = [
+            bcp_path, self.staging_table, 'in', data_path,
+            '-S', self.server, '-d', self.database,
+            '-w', '-k', '-t', '0x09', '-r', '0x0a', '-b', '10000',
+            '-m', '1', '-e', error_path, '-T'
+        ]
+        if self.trust_server_certificate:
+            command.append('-u')
+        return command
+        
+    @staticmethod
+    def _write_bcp_rows(data_file, rows: Iterable[tuple]):
+        """Write parameter rows as tab-delimited bcp character data (empty field = NULL)"""
+        for row in rows:
+            fields = []
+            for index, value in enumerate(row):
+                if value is None or (isinstance(value, float) and not math.isfinite(value)):
+                    # NaN and infinity have no DECIMAL representation; store NULL
+                    fields.append('')
+                elif index == 2:
+                    # ThingSpeak timestamps are ISO 8601 UTC ('2024-01-01T12:00:00Z')
+                    fields.append(str(value).replace('T', ' ').rstrip('Z'))
+                elif isinstance(value, float):
+                    # str() writes small and large floats in scientific notation
+                    # (1e-05), which DECIMAL columns reject; write plain digits
+                    fields.append(format(Decimal(repr(value)), 'f'))
+                else:
+                    # Terminator characters inside a value would split the row
+                    fields.append(str(value).replace('\t', ' ').replace('\r', ' ').replace('\n', ' '))
+            data_file.write('\t'.join(fields) + '\n')
+            
+    def _insert_reading_rows(self, rows: Iterable[tuple], table: str):
+        """
+        Insert prepared sensor reading rows as-is using the fewest round-trips
+        
+        Args:
+            rows: Parameter tuples in SensorReadings column order
+            table: Target table; rows are not de-duplicated, so this is meant
+                for a staging table
+        """
+        if self.fast_executemany:
+            # Send rows as parameter arrays, STREAM_CHUNK_ROWS at a time
+            sql = _format_sql(self._SQL_INSERT_READINGS, table=table, row_count=1, column_count=15)
+            cursor = self._cursor(sql)
+            cursor.fast_executemany = True
+            for chunk in _chunks(rows, STREAM_CHUNK_ROWS):
+                cursor.executemany(sql, chunk)
+            return
+        
+        # One multi-row INSERT per chunk, kept under the parameter limit
+        chunk_rows = MAX_PARAMETERS_PER_STATEMENT // 15
+        for chunk in _chunks(rows, chunk_rows):
+            sql = _format_sql(self._SQL_INSERT_READINGS, table=table,
+                              row_count=len(chunk), column_count=15)
+            with self._chunk_cursor(sql, len(chunk) == chunk_rows) as cursor:
+                cursor.execute(sql, list(chain.from_iterable(chunk)))
+            
     def call_stored_procedure(self, proc_name: str, params: tuple = None) -> Optional[List[Dict[str, Any]]]:
         """
         Execute a stored procedure
@@ -230,14 +713,11 @@ class DatabaseConnection:
             return None
             
         try:
-            cursor = self.connection.cursor()
-            
+            sql = _exec_statement(proc_name, len(params) if params else 0)
+            cursor = self._cursor(sql)
             if params:
-                placeholders = ','.join(['?' for _ in params])
-                sql = f"EXEC {proc_name} {placeholders}"
                 cursor.execute(sql, params)
             else:
-                sql = f"EXEC {proc_name}"
                 cursor.execute(sql)
             
             # Fetch results if any
@@ -246,18 +726,73 @@ class DatabaseConnection:
                 results = []
                 for row in cursor.fetchall():
                     results.append(dict(zip(columns, row)))
-                self.connection.commit()
+                self._commit()
                 logger.info(f"Executed stored procedure {proc_name}")
                 return results
             else:
-                self.connection.commit()
+                self._commit()
                 logger.info(f"Executed stored procedure {proc_name} (no results)")
                 return []
         except pyodbc.Error as e:
             logger.error(f"Error executing stored procedure {proc_name}: {e}")
+            if self._defer_commit:
+                raise
             self.connection.rollback()
             return None
             
+    def call_stored_procedures_batch(self, calls: List[Tuple[str, tuple]]) -> bool:
+        """
+        Execute several stored procedures in one round-trip and one commit
+        
+        Args:
+            calls: List of (proc_name, params) tuples
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        if not self.connection:
+            logger.error("No database connection")
+            return False
+            
+        if not calls:
+            return True
+            
+        try:
+            # The batch SQL varies with the calls, so use a throwaway cursor
+            cursor = self.connection.cursor()
+            try:
+                statements = []
+                batch_params = []
+                for proc_name, params in calls:
+                    params = params or ()
+                    # Flush before the batch would exceed the parameter limit
+                    if statements and len(batch_params) + len(params) > MAX_PARAMETERS_PER_STATEMENT:
+                        self._execute_batch(cursor, statements, batch_params)
+                        statements, batch_params = [], []
+                    statements.append(_exec_statement(proc_name, len(params)) + ";")
+                    batch_params.extend(params)
+                self._execute_batch(cursor, statements, batch_params)
+            finally:
+                cursor.close()
+            
+            self._commit()
+            logger.info(f"Executed {len(calls)} stored procedure calls in batch")
+            return True
+        except pyodbc.Error as e:
+            logger.error(f"Error executing stored procedure batch: {e}")
+            if self._defer_commit:
+                raise
+            self.connection.rollback()
+            return False
+            
+    @staticmethod
+    def _execute_batch(cursor, statements: List[str], params: List[Any]):
+        """Execute a multi-statement batch and drain its result sets"""
+        cursor.execute("\n".join(statements), params)
+        # Errors raised by later statements only surface while advancing
+        while cursor.nextset():
+            pass
+            
     @staticmethod
     def _safe_float(value: Any) -> Optional[float]:
         """Safely convert value to float"""
@@ -267,3 +802,81 @@ class DatabaseConnection:
             return float(value)
         except (ValueError, TypeError):
             return None
+
+
+class DatabasePool:
+    """Database connections for concurrent writers, opened on demand up to a fixed size"""
+    
+    def __init__(self, size: int, **connection_kwargs):
+        """
+        Initialize connection pool
+        
+        Args:
+            size: Maximum number of connections to open
+            **connection_kwargs: Arguments passed to each DatabaseConnection
+        """
+        self.size = max(1, size)
+        self.connection_kwargs = connection_kwargs
+        self._connections: List[DatabaseConnection] = []
+        self._available: Queue = Queue()
+        # Connections opened or being opened, guarded by _lock
+        self._opened = 0
+        self._lock = threading.Lock()
+        
+    def open(self) -> bool:
+        """
+        Open the first pooled connection, validating the configuration
+        
+        Further connections are opened by acquire() only when concurrent
+        callers need them, so runs with little to write stay on one connection.
+        
+        Returns:
+            True if the connection was established, False otherwise
+        """
+        db_connection = self._connect()
+        if not db_connection:
+            return False
+        self._opened = 1
+        self._available.put(db_connection)
+        
+        logger.info(f"Opened database pool (up to {self.size} connection(s))")
+        return True
+        
+    def _connect(self) -> Optional[DatabaseConnection]:
+        """Open and register a new connection, or return None if it fails"""
+        db_connection = DatabaseConnection(**self.connection_kwargs)
+        if not db_connection.connect():
+            return None
+        with self._lock:
+            self._connections.append(db_connection)
+        return db_connection
+        
+    @contextmanager
+    def acquire(self) -> Iterator[DatabaseConnection]:
+        """Borrow a connection, opening one if none is idle and the pool has room"""
+        db_connection = None
+        if self._available.empty():
+            with self._lock:
+                has_room = self._opened < self.size
+                if has_room:
+                    # Claim the slot before connecting so concurrent callers do not overshoot
+                    self._opened += 1
+            if has_room:
+                db_connection = self._connect()
+                if db_connection is None:
+                    with self._lock:
+                        self._opened -= 1
+        if db_connection is None:
+            db_connection = self._available.get()
+        try:
+            yield db_connection
+        finally:
+            self._available.put(db_connection)
+            
+    def close(self):
+        """Close all pooled connections"""
+        for db_connection in self._connections:
+            db_connection.disconnect()
+        self._connections = []
+        self._available = Queue()
+        self._opened = 0
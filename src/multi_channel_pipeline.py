@@ -5,12 +5,13 @@ Fetches data from multiple ThingSpeak channels and loads into MS SQL
 import os
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Optional, Tuple
-from dotenv import load_dotenv
 
-from thingspeak_client import ThingSpeakClient
-from database import DatabaseConnection
+from thingspeak_client import (ThingSpeakClient, ChannelMetadataCache, RateLimiter,
+                               create_session, CHANNEL_KEYS)
+from database import DatabasePool
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,13 +19,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Set once .env has been read so later pipeline instances skip re-parsing it
+_env_loaded = False
+
+
+def _load_env():
+    """Load .env into the process environment once per process"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    # Skip parsing .env when a wrapper (e.g. the cron job) already exported it
+    if not os.getenv('DB_SERVER'):
+        from dotenv import load_dotenv
+        load_dotenv()
+    _env_loaded = True
+
+
+def _valid_channel_id(channel_id: str) -> bool:
+    """Check that a configured channel ID is an integer, logging it if not"""
+    try:
+        int(channel_id)
+        return True
+    except ValueError:
+        logger.error(f"Invalid channel ID {channel_id!r} in configuration, skipping")
+        return False
+
 
 class ChannelConfig:
     """Configuration for a single ThingSpeak channel"""
     
-    def __init__(self, channel_id: str, api_key: Optional[str] = None, 
+    def __init__(self, channel_id: int, api_key: Optional[str] = None, 
                  enabled: bool = True, description: str = ""):
-        self.channel_id = channel_id
+        self.channel_id = int(channel_id)
         self.api_key = api_key
         self.enabled = enabled
         self.description = description
@@ -36,17 +62,30 @@ class ChannelConfig:
 class MultiChannelPipeline:
     """Pipeline for processing multiple IoT channels"""
     
-    def __init__(self, channels: List[ChannelConfig] = None):
+    def __init__(self, channels: List[ChannelConfig] = None, fetch_workers: int = 16,
+                 max_db_connections: int = 8):
         """
         Initialize multi-channel pipeline
         
         Args:
             channels: List of ChannelConfig objects. If None, loads from environment.
+            fetch_workers: Maximum number of channels fetched from ThingSpeak concurrently
+            max_db_connections: Maximum number of channels written to the database concurrently
         """
-        load_dotenv()
+        _load_env()
         
         # Channel configurations
         self.channels = channels or self._load_channels_from_env()
+        self.fetch_workers = fetch_workers
+        self.max_db_connections = max_db_connections
+        
+        # One limiter shared by all channel clients keeps concurrent fetches
+        # within the account-wide ThingSpeak rate limit
+        self.api_requests_per_second = float(os.getenv('THINGSPEAK_REQUESTS_PER_SECOND', '1.0'))
+        self.rate_limiter = RateLimiter(1.0 / self.api_requests_per_second)
+        
+        # HTTP session shared by all channel clients (one connection per fetch worker)
+        self.http_session = None
         
         # Database configuration
         self.db_server = os.getenv('DB_SERVER')
@@ -54,9 +93,16 @@ class MultiChannelPipeline:
         self.db_username = os.getenv('DB_USERNAME')
         self.db_password = os.getenv('DB_PASSWORD')
         self.db_trusted_connection = os.getenv('DB_TRUSTED_CONNECTION', 'False').lower() == 'true'
+        self.db_memory_optimized_staging = os.getenv('DB_MEMORY_OPTIMIZED_STAGING', 'False').lower() == 'true'
+        self.db_encrypt = os.getenv('DB_ENCRYPT', 'True').lower() == 'true'
+        self.db_trust_server_certificate = os.getenv('DB_TRUST_SERVER_CERTIFICATE', 'False').lower() == 'true'
+        
+        # Database connection pool (one connection per concurrent channel writer)
+        self.db_pool = None
         
-        # Initialize database connection (shared across channels)
-        self.db_connection = None
+        # Channel metadata reused across runs until its TTL expires; fresh
+        # entries skip both the metadata fetch and the upsert
+        self.metadata_cache = ChannelMetadataCache()
         
         # Statistics
         self.stats = {
@@ -90,6 +136,9 @@ class MultiChannelPipeline:
                 api_keys.append(None)
             
             for channel_id, api_key in zip(channel_ids, api_keys):
+                # Skip a malformed ID instead of aborting the whole run
+                if not _valid_channel_id(channel_id):
+                    continue
                 channels.append(ChannelConfig(
                     channel_id=channel_id,
                     api_key=api_key if api_key else None,
@@ -102,7 +151,7 @@ class MultiChannelPipeline:
             channel_id = os.getenv('THINGSPEAK_CHANNEL_ID')
             api_key = os.getenv('THINGSPEAK_API_KEY')
             
-            if channel_id:
+            if channel_id and _valid_channel_id(channel_id):
                 channels.append(ChannelConfig(
                     channel_id=channel_id,
                     api_key=api_key if api_key else None,
@@ -117,7 +166,7 @@ class MultiChannelPipeline:
     
     def initialize_database(self) -> bool:
         """
-        Initialize database connection
+        Initialize database connection pool
         
         Returns:
             True if successful, False otherwise
@@ -127,15 +176,19 @@ class MultiChannelPipeline:
                 logger.error("Database configuration incomplete")
                 return False
             
-            self.db_connection = DatabaseConnection(
+            self.db_pool = DatabasePool(
+                size=min(len(self.channels), self.max_db_connections),
                 server=self.db_server,
                 database=self.db_name,
                 username=self.db_username,
                 password=self.db_password,
-                trusted_connection=self.db_trusted_connection
+                trusted_connection=self.db_trusted_connection,
+                memory_optimized_staging=self.db_memory_optimized_staging,
+                encrypt=self.db_encrypt,
+                trust_server_certificate=self.db_trust_server_certificate
             )
             
-            if not self.db_connection.connect():
+            if not self.db_pool.open():
                 logger.error("Failed to connect to database")
                 return False
             
@@ -146,117 +199,146 @@ class MultiChannelPipeline:
             logger.error(f"Database initialization error: {e}")
             return False
     
-    def process_channel(self, channel_config: ChannelConfig, 
-                       fetch_results: int = 100) -> Tuple[bool, int]:
+    def fetch_channel(self, channel_config: ChannelConfig,
+                      fetch_results: int = 100,
+                      last_entry: Optional[Tuple[int, datetime]] = None
+                      ) -> Optional[Tuple[Optional[Dict], List[Dict]]]:
         """
-        Process a single channel
+        Fetch metadata and sensor readings for a single channel
         
         Args:
             channel_config: Channel configuration
             fetch_results: Number of results to fetch
+            last_entry: (EntryID, CreatedAt) of the newest stored reading; only
+                newer entries are returned
             
         Returns:
-            Tuple of (success: bool, records_inserted: int)
+            Tuple of (channel_data: dict, feeds: list) or None if error.
+            channel_data is None when cached metadata is still fresh.
         """
-        if not channel_config.enabled:
-            logger.info(f"Skipping disabled channel {channel_config.channel_id}")
-            return True, 0
+        logger.info(f"Fetching channel {channel_config.channel_id}")
         
-        logger.info(f"Processing channel {channel_config.channel_id}")
+        # Initialize ThingSpeak client for this channel
+        client = ThingSpeakClient(
+            channel_id=channel_config.channel_id,
+            api_key=channel_config.api_key,
+            rate_limiter=self.rate_limiter,
+            session=self.http_session
+        )
         
         try:
-            # Initialize ThingSpeak client for this channel
-            client = ThingSpeakClient(
-                channel_id=channel_config.channel_id,
-                api_key=channel_config.api_key
-            )
-            
-            # Sync channel metadata
-            logger.info(f"  Syncing metadata for channel {channel_config.channel_id}...")
-            channel_info = client.get_channel_info()
-            if not channel_info:
-                logger.error(f"  Failed to fetch channel info for {channel_config.channel_id}")
-                return False, 0
-            
-            channel_data = {
-                'id': channel_info.get('id'),
-                'name': channel_info.get('name'),
-                'description': channel_info.get('description'),
-                'latitude': channel_info.get('latitude'),
-                'longitude': channel_info.get('longitude'),
-                'field1': channel_info.get('field1'),
-                'field2': channel_info.get('field2'),
-                'field3': channel_info.get('field3'),
-                'field4': channel_info.get('field4'),
-                'field5': channel_info.get('field5'),
-                'field6': channel_info.get('field6'),
-                'field7': channel_info.get('field7'),
-                'field8': channel_info.get('field8'),
-            }
-            
-            if not self.db_connection.upsert_channel(channel_data):
-                logger.error(f"  Failed to upsert channel metadata for {channel_config.channel_id}")
-                return False, 0
+            # Fetch channel metadata unless the cached copy is still fresh
+            channel_data = None
+            if self.metadata_cache.get(channel_config.channel_id):
+                logger.info(f"  Metadata for channel {channel_config.channel_id} cached, skipping fetch")
+            else:
+                logger.info(f"  Fetching metadata for channel {channel_config.channel_id}...")
+                channel_info = client.get_channel_info()
+                if not channel_info:
+                    logger.error(f"  Failed to fetch channel info for {channel_config.channel_id}")
+                    return None
+                
+                channel_data = {key: channel_info.get(key) for key in CHANNEL_KEYS}
             
-            # Fetch and store sensor data
+            # Fetch sensor data
             logger.info(f"  Fetching {fetch_results} readings for channel {channel_config.channel_id}...")
-            feed_data = client.get_channel_feed(results=fetch_results)
+            if last_entry:
+                feed_data = client.get_channel_feed(results=fetch_results, start=last_entry[1],
+                                                    min_entry_id=last_entry[0] + 1)
+            else:
+                feed_data = client.get_channel_feed(results=fetch_results)
             if not feed_data:
                 logger.error(f"  Failed to fetch feed data for {channel_config.channel_id}")
-                return False, 0
+                return None
             
-            feeds = feed_data.get('feeds', [])
+            return channel_data, feed_data.get('feeds', [])
+            
+        except Exception as e:
+            logger.error(f"  ❌ Error fetching channel {channel_config.channel_id}: {e}", exc_info=True)
+            self._record_error(channel_config.channel_id, e)
+            return None
+        finally:
+            client.close()
+    
+    def process_channel(self, channel_config: ChannelConfig,
+                       feeds: List[Dict]) -> Tuple[bool, int]:
+        """
+        Store fetched readings for a single channel
+        
+        The channel's metadata must already be upserted and its aggregations are
+        refreshed afterwards (see run_full_pipeline).
+        Safe to call from worker threads; each call borrows its own pooled connection.
+        
+        Args:
+            channel_config: Channel configuration
+            feeds: Feed entries returned by fetch_channel
+            
+        Returns:
+            Tuple of (success: bool, records_inserted: int)
+        """
+        logger.info(f"Processing channel {channel_config.channel_id}")
+        
+        try:
             if not feeds:
-                logger.warning(f"  No feed data available for channel {channel_config.channel_id}")
+                logger.info(f"  No new feed data available for channel {channel_config.channel_id}")
                 return True, 0
             
-            inserted = self.db_connection.insert_sensor_readings(
-                channel_id=int(channel_config.channel_id),
-                feeds=feeds
-            )
+            # Insert readings; aggregations are batched once all channels are stored
+            with self.db_pool.acquire() as db_connection:
+                inserted = db_connection.ingest_channel_batch(
+                    channel_id=channel_config.channel_id,
+                    feeds=feeds,
+                    run_aggregations=False
+                )
             
-            logger.info(f"  ✅ Channel {channel_config.channel_id}: {inserted} records inserted")
+            if inserted < 0:
+                logger.error(f"  Failed to ingest readings for channel {channel_config.channel_id}")
+                return False, 0
             
-            # Process aggregations for this channel
-            self.process_channel_aggregations(channel_config.channel_id)
+            logger.info(f"  ✅ Channel {channel_config.channel_id}: {inserted} records inserted")
             
             return True, inserted
             
         except Exception as e:
             logger.error(f"  ❌ Error processing channel {channel_config.channel_id}: {e}", exc_info=True)
-            self.stats['errors'].append({
-                'channel_id': channel_config.channel_id,
-                'error': str(e),
-                'timestamp': datetime.utcnow().isoformat()
-            })
+            self._record_error(channel_config.channel_id, e)
             return False, 0
     
-    def process_channel_aggregations(self, channel_id: str):
+    def process_aggregations(self, channel_ids: List[int],
+                             aggregation_types: Tuple[str, ...] = ('HOURLY', 'DAILY')) -> bool:
         """
-        Process aggregations for a single channel
+        Refresh aggregations for several channels in one batched EXEC
         
         Args:
-            channel_id: Channel ID to process
-        """
-        try:
-            logger.info(f"  Processing aggregations for channel {channel_id}...")
-            
-            # HOURLY aggregation
-            self.db_connection.call_stored_procedure(
-                'iot.usp_ProcessSensorReadings',
-                params=(int(channel_id), 'HOURLY', None, None)
-            )
-            
-            # DAILY aggregation
-            self.db_connection.call_stored_procedure(
-                'iot.usp_ProcessSensorReadings',
-                params=(int(channel_id), 'DAILY', None, None)
-            )
+            channel_ids: Channels whose readings were stored this run
+            aggregation_types: Aggregation grains to refresh (HOURLY and/or DAILY)
             
-            logger.info(f"  ✅ Aggregations completed for channel {channel_id}")
-            
-        except Exception as e:
-            logger.warning(f"  ⚠️  Aggregation error for channel {channel_id}: {e}")
+        Returns:
+            True if successful, False otherwise
+        """
+        run_hourly = 'HOURLY' in aggregation_types
+        run_daily = 'DAILY' in aggregation_types
+        calls = [
+            ('iot.usp_RunPostIngest', (channel_id, run_hourly, run_daily, False))
+            for channel_id in channel_ids
+        ]
+        
+        logger.info(f"Processing {', '.join(aggregation_types)} aggregations for "
+                    f"{len(channel_ids)} channel(s)")
+        with self.db_pool.acquire() as db_connection:
+            success = db_connection.call_stored_procedures_batch(calls)
+        
+        if not success:
+            logger.error("Failed to process aggregations")
+        return success
+    
+    def _record_error(self, channel_id: int, error: Exception):
+        """Record a channel error for the execution summary"""
+        self.stats['errors'].append({
+            'channel_id': channel_id,
+            'error': str(error),
+            'timestamp': datetime.utcnow().isoformat()
+        })
     
     def run_full_pipeline(self, fetch_results: int = 100):
         """
@@ -284,17 +366,89 @@ class MultiChannelPipeline:
                 logger.error("Pipeline initialization failed")
                 return
             
-            # Process each channel
-            for i, channel_config in enumerate(self.channels, 1):
-                logger.info(f"\n[{i}/{len(self.channels)}] Processing {channel_config}")
+            # Fetch metadata and readings for every enabled channel concurrently
+            enabled_channels = []
+            for channel_config in self.channels:
+                if channel_config.enabled:
+                    enabled_channels.append(channel_config)
+                else:
+                    logger.info(f"Skipping disabled channel {channel_config.channel_id}")
+                    self.stats['channels_processed'] += 1
+            
+            fetched = []
+            if enabled_channels:
+                # Watermarks for incremental fetches, read in a single query
+                with self.db_pool.acquire() as db_connection:
+                    last_entries = db_connection.get_last_entries(
+                        [channel_config.channel_id for channel_config in enabled_channels]
+                    )
                 
-                success, records = self.process_channel(channel_config, fetch_results)
+                self.http_session = create_session(pool_maxsize=self.fetch_workers)
+                logger.info(f"Fetching {len(enabled_channels)} channels "
+                            f"({min(self.fetch_workers, len(enabled_channels))} concurrent)")
+                with ThreadPoolExecutor(max_workers=self.fetch_workers) as executor:
+                    results = executor.map(
+                        lambda channel_config: self.fetch_channel(
+                            channel_config, fetch_results,
+                            last_entries.get(channel_config.channel_id)
+                        ),
+                        enabled_channels
+                    )
+                    for channel_config, result in zip(enabled_channels, results):
+                        if result:
+                            fetched.append((channel_config, *result))
+                        else:
+                            self.stats['channels_failed'] += 1
+            
+            # Upsert fetched channel metadata in a single MERGE; channels
+            # whose cached metadata is fresh came back without any, and
+            # metadata matching the expired cached copy only refreshes it
+            if fetched:
+                changed = {}
+                for _, channel_data, _ in fetched:
+                    if channel_data is None:
+                        continue
+                    if channel_data == self.metadata_cache.get(channel_data['id'], include_expired=True):
+                        self.metadata_cache.set(channel_data['id'], channel_data)
+                    else:
+                        changed[channel_data['id']] = channel_data
                 
-                if success:
-                    self.stats['channels_processed'] += 1
-                    self.stats['total_records'] += records
+                if changed:
+                    with self.db_pool.acquire() as db_connection:
+                        upserted = db_connection.upsert_channels(list(changed.values()))
+                    if upserted:
+                        for channel_id, channel_data in changed.items():
+                            self.metadata_cache.set(channel_id, channel_data)
+                        self.metadata_cache.save()
+                    else:
+                        logger.error("Failed to upsert channel metadata")
+                        self.stats['channels_failed'] += len(fetched)
+                        fetched = []
                 else:
-                    self.stats['channels_failed'] += 1
+                    logger.info("Channel metadata cached or unchanged, skipping upsert")
+                    self.metadata_cache.save()
+            
+            # Store readings for each channel, one pooled connection per
+            # concurrent writer
+            stored_channel_ids = []
+            if fetched:
+                with ThreadPoolExecutor(max_workers=self.db_pool.size) as executor:
+                    results = executor.map(
+                        lambda item: self.process_channel(item[0], item[2]),
+                        fetched
+                    )
+                    for (channel_config, _, feeds), (success, records) in zip(fetched, results):
+                        if success:
+                            self.stats['channels_processed'] += 1
+                            self.stats['total_records'] += records
+                            if feeds:
+                                stored_channel_ids.append(channel_config.channel_id)
+                        else:
+                            self.stats['channels_failed'] += 1
+            
+            # Refresh aggregations for every stored channel in one batch
+            if stored_channel_ids:
+                self.process_aggregations(stored_channel_ids)
             
             # Print summary
             self._print_summary()
@@ -302,8 +456,11 @@ class MultiChannelPipeline:
         except Exception as e:
             logger.error(f"Pipeline error: {e}", exc_info=True)
         finally:
-            if self.db_connection:
-                self.db_connection.disconnect()
+            if self.http_session:
+                self.http_session.close()
+                self.http_session = None
+            if self.db_pool:
+                self.db_pool.close()
     
     def _print_summary(self):
         """Print pipeline execution summary"""
@@ -332,9 +489,9 @@ def main():
     """Main entry point"""
     # Example: Can configure channels programmatically
     # channels = [
-    #     ChannelConfig("9", description="Weather Station"),
-    #     ChannelConfig("12397", description="Air Quality Monitor"),
-    #     ChannelConfig("301051", description="Temperature Sensors"),
+    #     ChannelConfig(9, description="Weather Station"),
+    #     ChannelConfig(12397, description="Air Quality Monitor"),
+    #     ChannelConfig(301051, description="Temperature Sensors"),
     # ]
     # pipeline = MultiChannelPipeline(channels=channels)
     
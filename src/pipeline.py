@@ -5,10 +5,13 @@ Main orchestration script that fetches data from ThingSpeak and loads it into MS
 import os
 import sys
 import logging
+import threading
 from datetime import datetime
-from dotenv import load_dotenv
+from itertools import islice
+from queue import Queue, Full
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 
-from thingspeak_client import ThingSpeakClient
+from thingspeak_client import ThingSpeakClient, ChannelMetadataCache, CHANNEL_KEYS
 from database import DatabaseConnection
 
 logging.basicConfig(
@@ -18,15 +21,77 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def _read_ahead(items: Iterable, batch_size: int = 1000, max_batches: int = 4) -> Iterator:
+    """
+    Iterate items while a background thread reads ahead of the consumer
+    
+    The producer thread pulls batches of up to batch_size items into a
+    bounded queue, so a streamed download keeps progressing while the
+    consumer is blocked on database inserts.
+    
+    Args:
+        items: Iterable to read ahead of (e.g. a streamed feed)
+        batch_size: Items handed over per queue entry
+        max_batches: Batches buffered before the producer waits
+        
+    Returns:
+        Iterator over the same items, in order. Errors raised by the producer
+        are re-raised to the consumer.
+    """
+    batches: Queue = Queue(maxsize=max_batches)
+    stopped = threading.Event()
+    done = object()
+    
+    def put(entry) -> bool:
+        # Poll so an abandoned consumer does not leave this thread blocked
+        while not stopped.is_set():
+            try:
+                batches.put(entry, timeout=0.5)
+                return True
+            except Full:
+                continue
+        return False
+    
+    def produce():
+        iterator = iter(items)
+        try:
+            for batch in iter(lambda: list(islice(iterator, batch_size)), []):
+                if not put(batch):
+                    return
+            put(done)
+        except Exception as e:
+            put(e)
+    
+    def consume():
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is done:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                yield from batch
+        finally:
+            stopped.set()
+    
+    return consume()
+
+
 class IoTDataPipeline:
     """Main pipeline for processing IoT data"""
     
     def __init__(self):
         """Initialize pipeline with configuration"""
-        load_dotenv()
+        # Skip parsing .env when a wrapper (e.g. the cron job) already exported it
+        if not os.getenv('THINGSPEAK_CHANNEL_ID'):
+            from dotenv import load_dotenv
+            load_dotenv()
         
         # ThingSpeak configuration
         self.channel_id = os.getenv('THINGSPEAK_CHANNEL_ID')
+        self.channel_id_int = None
         self.api_key = os.getenv('THINGSPEAK_API_KEY')
         
         # Database configuration
@@ -35,11 +100,26 @@ class IoTDataPipeline:
         self.db_username = os.getenv('DB_USERNAME')
         self.db_password = os.getenv('DB_PASSWORD')
         self.db_trusted_connection = os.getenv('DB_TRUSTED_CONNECTION', 'False').lower() == 'true'
+        self.db_memory_optimized_staging = os.getenv('DB_MEMORY_OPTIMIZED_STAGING', 'False').lower() == 'true'
+        self.db_encrypt = os.getenv('DB_ENCRYPT', 'True').lower() == 'true'
+        self.db_trust_server_certificate = os.getenv('DB_TRUST_SERVER_CERTIFICATE', 'False').lower() == 'true'
+        
+        # Feed batches at least this large use the bcp bulk-copy path when
+        # bulk loading is enabled (DB_BULK_LOAD=True)
+        self.bulk_load = os.getenv('DB_BULK_LOAD', 'False').lower() == 'true'
+        self.bulk_threshold = 5000
+        
+        # Channel metadata reused across runs until its TTL expires
+        self.metadata_cache = ChannelMetadataCache()
         
         # Initialize clients
         self.thingspeak_client = None
         self.db_connection = None
         
+        # Newest stored entry (ID and UTC timestamp); only newer entries are fetched
+        self.last_entry_id = None
+        self.last_entry_time = None
+        
     def initialize(self) -> bool:
         """
         Initialize API client and database connection
@@ -52,6 +132,7 @@ class IoTDataPipeline:
             if not self.channel_id:
                 logger.error("THINGSPEAK_CHANNEL_ID not configured")
                 return False
+            self.channel_id_int = int(self.channel_id)
                 
             self.thingspeak_client = ThingSpeakClient(
                 channel_id=self.channel_id,
@@ -69,78 +150,141 @@ class IoTDataPipeline:
                 database=self.db_name,
                 username=self.db_username,
                 password=self.db_password,
-                trusted_connection=self.db_trusted_connection
+                trusted_connection=self.db_trusted_connection,
+                memory_optimized_staging=self.db_memory_optimized_staging,
+                encrypt=self.db_encrypt,
+                trust_server_certificate=self.db_trust_server_certificate
             )
             
             if not self.db_connection.connect():
                 logger.error("Failed to connect to database")
                 return False
                 
+            last_entry = self.db_connection.get_last_entries([self.channel_id_int]).get(self.channel_id_int)
+            if last_entry:
+                self.last_entry_id, self.last_entry_time = last_entry
+                logger.info(f"Resuming after entry {self.last_entry_id} ({self.last_entry_time})")
+                
             return True
         except Exception as e:
             logger.error(f"Initialization error: {e}")
             return False
             
-    def sync_channel_metadata(self) -> bool:
+    def sync_channel_metadata(self) -> Tuple[bool, Optional[Dict]]:
         """
         Fetch and store channel metadata
         
+        Metadata identical to the cached copy, even an expired one, is not
+        upserted again. The metadata cache is not updated here: inside a
+        transaction() block the upsert is not durable yet, so the caller
+        caches the returned metadata once it has committed.
+        
         Returns:
-            True if successful, False otherwise
+            Tuple of (True if successful, fetched metadata to cache or None if
+            the cached metadata was still fresh)
         """
         logger.info("Syncing channel metadata...")
         
+        if self.metadata_cache.get(self.channel_id):
+            logger.info("Channel metadata cached and fresh, skipping sync")
+            return True, None
+            
         channel_info = self.thingspeak_client.get_channel_info()
         if not channel_info:
             logger.error("Failed to fetch channel info")
-            return False
+            return False, None
+            
+        channel_data = {key: channel_info.get(key) for key in CHANNEL_KEYS}
+        
+        if channel_data == self.metadata_cache.get(self.channel_id, include_expired=True):
+            logger.info("Channel metadata unchanged, skipping upsert")
+            return True, channel_data
             
-        channel_data = {
-            'id': channel_info.get('id'),
-            'name': channel_info.get('name'),
-            'description': channel_info.get('description'),
-            'latitude': channel_info.get('latitude'),
-            'longitude': channel_info.get('longitude'),
-            'field1': channel_info.get('field1'),
-            'field2': channel_info.get('field2'),
-            'field3': channel_info.get('field3'),
-            'field4': channel_info.get('field4'),
-            'field5': channel_info.get('field5'),
-            'field6': channel_info.get('field6'),
-            'field7': channel_info.get('field7'),
-            'field8': channel_info.get('field8'),
-        }
-        
-        return self.db_connection.upsert_channel(channel_data)
-        
-    def fetch_and_store_data(self, results: int = 100) -> int:
+        if not self.db_connection.upsert_channel(channel_data):
+            return False, None
+            
+        return True, channel_data
+        
+    def fetch_and_store_data(self, results: int = 100, bulk_load: bool = False) -> int:
         """
         Fetch sensor data and store in database
         
         Args:
             results: Number of results to fetch
+            bulk_load: Load batches of at least bulk_threshold readings with
+                bcp bulk copy (for historical backfills)
             
         Returns:
             Number of records stored
         """
         logger.info(f"Fetching {results} sensor readings...")
         
-        feed_data = self.thingspeak_client.get_channel_feed(results=results)
+        if self.last_entry_id is None and not bulk_load:
+            return self._stream_and_store_data(results)
+            
+        feed_data = self.thingspeak_client.get_channel_feed(
+            results=results,
+            start=self.last_entry_time,
+            min_entry_id=self.last_entry_id + 1 if self.last_entry_id is not None else None
+        )
         if not feed_data:
             logger.error("Failed to fetch channel feed")
             return 0
             
         feeds = feed_data.get('feeds', [])
         if not feeds:
-            logger.warning("No feed data available")
+            logger.info("No new feed data available")
             return 0
             
         # Store sensor readings
+        if bulk_load and len(feeds) >= self.bulk_threshold:
+            inserted = self.db_connection.bulk_insert_sensor_readings(
+                channel_id=self.channel_id_int,
+                feeds=feeds
+            )
+        else:
+            inserted = self.db_connection.insert_sensor_readings(
+                channel_id=self.channel_id_int,
+                feeds=feeds
+            )
+        
+        if inserted:
+            newest = max(feeds, key=lambda feed: feed['entry_id'])
+            self.last_entry_id = newest['entry_id']
+            self.last_entry_time = datetime.strptime(newest['created_at'], '%Y-%m-%dT%H:%M:%SZ')
+        
+        return inserted
+        
+    def _stream_and_store_data(self, results: int) -> int:
+        """
+        Stream a channel's first full feed window straight into the database
+        
+        Entries are stored in chunks while a background thread keeps reading
+        the response, so network transfer and inserts overlap and memory
+        stays bounded.
+        
+        Args:
+            results: Number of results to fetch
+            
+        Returns:
+            Number of records stored
+        """
+        feeds = self.thingspeak_client.iter_channel_feed(results=results)
+        if feeds is None:
+            logger.error("Failed to fetch channel feed")
+            return 0
+            
+        # Keep downloading in the background while chunks are inserted
         inserted = self.db_connection.insert_sensor_readings(
-            channel_id=int(self.channel_id),
-            feeds=feeds
+            channel_id=self.channel_id_int,
+            feeds=_read_ahead(feeds)
         )
         
+        if inserted:
+            last_entry = self.db_connection.get_last_entries([self.channel_id_int]).get(self.channel_id_int)
+            if last_entry:
+                self.last_entry_id, self.last_entry_time = last_entry
+        
         return inserted
         
     def process_aggregations(self, aggregation_type: str = 'DAILY') -> bool:
@@ -157,7 +301,7 @@ class IoTDataPipeline:
         
         result = self.db_connection.call_stored_procedure(
             'iot.usp_ProcessSensorReadings',
-            params=(int(self.channel_id), aggregation_type, None, None)
+            params=(self.channel_id_int, aggregation_type, None, None)
         )
         
         return result is not None
@@ -173,7 +317,7 @@ class IoTDataPipeline:
         
         result = self.db_connection.call_stored_procedure(
             'iot.usp_CalculateDataQuality',
-            params=(int(self.channel_id), None)
+            params=(self.channel_id_int, None)
         )
         
         if result:
@@ -181,6 +325,25 @@ class IoTDataPipeline:
             return True
         return False
         
+    def run_post_ingest(self) -> bool:
+        """
+        Run HOURLY and DAILY aggregations and the data quality check in a
+        single stored procedure call
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        logger.info("Processing aggregations and data quality metrics...")
+        
+        result = self.db_connection.call_stored_procedure(
+            'iot.usp_RunPostIngest',
+            params=(self.channel_id_int, 1, 1, 1)
+        )
+        
+        if result:
+            logger.info(f"Data quality results: {result}")
+        return result is not None
+        
     def run_full_pipeline(self, fetch_results: int = 100):
         """
         Execute the full data pipeline
@@ -198,22 +361,30 @@ class IoTDataPipeline:
                 logger.error("Pipeline initialization failed")
                 return
                 
-            # Sync channel metadata
-            if not self.sync_channel_metadata():
-                logger.error("Failed to sync channel metadata")
-                return
-                
-            # Fetch and store sensor data
-            records_stored = self.fetch_and_store_data(results=fetch_results)
-            logger.info(f"Stored {records_stored} new sensor readings")
+            # Ingest stage: channel metadata and sensor data share one commit,
+            # skipped entirely when metadata is cached and no readings are new
+            with self.db_connection.transaction():
+                # Sync channel metadata
+                synced, channel_data = self.sync_channel_metadata()
+                if not synced:
+                    logger.error("Failed to sync channel metadata")
+                    return
+                    
+                # Fetch and store sensor data
+                records_stored = self.fetch_and_store_data(results=fetch_results,
+                                                           bulk_load=self.bulk_load)
+                logger.info(f"Stored {records_stored} new sensor readings")
             
-            # Process aggregations
+            # Mark metadata fresh only after its upsert has been committed
+            if channel_data:
+                self.metadata_cache.set(self.channel_id, channel_data)
+                self.metadata_cache.save()
+            
+            # Post-processing stage: aggregations and data quality in one call
             if records_stored > 0:
-                self.process_aggregations('HOURLY')
-                self.process_aggregations('DAILY')
-                
-                # Calculate data quality
-                self.calculate_data_quality()
+                self.run_post_ingest()
+            else:
+                logger.info("No new readings, skipping post-processing")
                 
             logger.info("=" * 60)
             logger.info("Pipeline completed successfully")
@@ -222,6 +393,8 @@ class IoTDataPipeline:
         except Exception as e:
             logger.error(f"Pipeline error: {e}", exc_info=True)
         finally:
+            if self.thingspeak_client:
+                self.thingspeak_client.close()
             if self.db_connection:
                 self.db_connection.disconnect()
 
@@ -2,21 +2,202 @@
 ThingSpeak IoT API Client
 Fetches real-time sensor data from ThingSpeak public channels
 """
+import json
+import os
+import random
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
 import time
-from typing import Dict, List, Optional
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
 import logging
 
+try:
+    import orjson
+except ImportError:  # Fall back to requests' stdlib json decoding
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # Fall back to decoding streamed feeds in full
+    ijson = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# ThingSpeak returns at most this many entries per feed request
+MAX_FEED_RESULTS = 8000
+
+# Keys of the eight channel fields, used for both field names and readings
+FIELD_KEYS = tuple(f'field{i}' for i in range(1, 9))
+
+# Channel info keys stored as channel metadata (iot.Channels)
+CHANNEL_KEYS = ('id', 'name', 'description', 'latitude', 'longitude') + FIELD_KEYS
+
+
+def _decode_json(response: requests.Response):
+    """Decode a JSON response body, with orjson when it is installed"""
+    # Feed payloads can be several MB; orjson decodes them much faster
+    return orjson.loads(response.content) if orjson else response.json()
+
+
+class _JitteredRetry(Retry):
+    """Retry policy adding random jitter to the exponential backoff
+    
+    Clients sharing a rate limit tend to be throttled together; jitter keeps
+    them from retrying in lockstep. A Retry-After header, when sent, still
+    takes precedence over the backoff.
+    """
+    
+    def get_backoff_time(self) -> float:
+        return super().get_backoff_time() + random.uniform(0, self.backoff_factor)
+
+
+def create_session(pool_maxsize: int = 10, retries: int = 3,
+                   backoff_factor: float = 0.3) -> requests.Session:
+    """
+    Create an HTTP session that keeps connections to ThingSpeak alive
+    
+    Args:
+        pool_maxsize: Connections kept open per host; match the number of
+            threads sharing the session
+        retries: Attempts to repeat a request after a connection error,
+            429 (rate limited) or 5xx response
+        backoff_factor: Base delay in seconds, doubled on each retry
+        
+    Returns:
+        Session retrying transient failures with jittered exponential backoff
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=pool_maxsize,
+        max_retries=_JitteredRetry(total=retries, backoff_factor=backoff_factor,
+                                   status_forcelist=[429, 500, 502, 503, 504])
+    )
+    session.mount("https://", adapter)
+    return session
+
+
+class RateLimiter:
+    """Thread-safe token bucket pacing requests to one per interval
+    
+    Requests proceed immediately while tokens are available, so a short
+    burst after an idle period (e.g. metadata then feed for one channel) is
+    not delayed; only sustained load is paced. A single instance can be
+    shared by several clients so that concurrent channel fetches stay within
+    the account-wide ThingSpeak rate limit.
+    """
+    
+    def __init__(self, min_interval: float = 1.0, burst: int = 2):
+        """
+        Initialize rate limiter
+        
+        Args:
+            min_interval: Average delay between requests in seconds
+            burst: Maximum number of requests allowed back-to-back after idling
+        """
+        self.min_interval = min_interval
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        
+    def wait(self):
+        """Block until a request token is available"""
+        if self.min_interval <= 0:
+            return
+        # Take a token under the lock (going negative reserves a future one),
+        # then sleep outside it so waiting threads do not serialize on the lock
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._last_refill) / self.min_interval)
+            self._last_refill = now
+            self._tokens -= 1
+            delay = -self._tokens * self.min_interval
+        # Skip sub-millisecond sleeps that would only cost a context switch
+        if delay > 0.001:
+            time.sleep(delay)
+
+
+class ChannelMetadataCache:
+    """Channel metadata persisted to disk and reused until a TTL expires
+    
+    Channel names, field labels and locations rarely change, so fresh
+    entries let the pipelines skip both the metadata request and the
+    database upsert.
+    """
+    
+    def __init__(self, path: str = '.cache/channel_meta.json', ttl_seconds: float = 6 * 3600):
+        """
+        Initialize metadata cache, loading any entries saved by earlier runs
+        
+        Args:
+            path: JSON file the cache is persisted to
+            ttl_seconds: How long cached metadata is considered fresh
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        
+    def _load(self) -> Dict[str, Dict]:
+        """Read saved entries, starting empty if the file is missing or unreadable"""
+        try:
+            with open(self.path, 'rb') as cache_file:
+                content = cache_file.read()
+            return orjson.loads(content) if orjson else json.loads(content)
+        except (OSError, ValueError):
+            return {}
+            
+    def get(self, channel_id: str, include_expired: bool = False) -> Optional[Dict]:
+        """
+        Get cached metadata for a channel
+        
+        Args:
+            channel_id: ThingSpeak channel ID
+            include_expired: Also return an expired entry, e.g. to check
+                whether freshly fetched metadata has changed
+            
+        Returns:
+            Cached metadata, or None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(str(channel_id))
+        if entry and (include_expired or time.time() - entry['fetched_at'] < self.ttl_seconds):
+            return entry['metadata']
+        return None
+        
+    def set(self, channel_id: str, metadata: Dict):
+        """Cache metadata for a channel as fetched now"""
+        with self._lock:
+            self._entries[str(channel_id)] = {'metadata': metadata, 'fetched_at': time.time()}
+            
+    def save(self):
+        """Persist the cache, replacing the file atomically"""
+        with self._lock:
+            payload = orjson.dumps(self._entries) if orjson else json.dumps(self._entries).encode('utf-8')
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'wb') as cache_file:
+                cache_file.write(payload)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save channel metadata cache: {e}")
+
 
 class ThingSpeakClient:
     """Client for interacting with ThingSpeak IoT API"""
     
     BASE_URL = "https://api.thingspeak.com"
     
-    def __init__(self, channel_id: str, api_key: Optional[str] = None, rate_limit_delay: float = 1.0):
+    def __init__(self, channel_id: str, api_key: Optional[str] = None, rate_limit_delay: float = 1.0,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 session: Optional[requests.Session] = None):
         """
         Initialize ThingSpeak client
         
@@ -24,47 +205,138 @@ class ThingSpeakClient:
             channel_id: ThingSpeak channel ID
             api_key: Optional API key for private channels
             rate_limit_delay: Delay between API calls in seconds
+            rate_limiter: Limiter shared with other clients; overrides
+                rate_limit_delay when given
+            session: HTTP session shared with other clients. If None, the
+                client creates (and close() closes) its own.
         """
         self.channel_id = channel_id
         self.api_key = api_key
         self.rate_limit_delay = rate_limit_delay
-        self.last_request_time = 0
+        self.rate_limiter = rate_limiter or RateLimiter(rate_limit_delay)
+        # Reusing one session keeps the TCP/TLS connection alive between calls
+        self._owns_session = session is None
+        self.session = session or create_session()
+        
+    def close(self):
+        """Close the HTTP session if this client created it"""
+        if self._owns_session:
+            self.session.close()
         
     def _rate_limit(self):
         """Implement rate limiting between requests"""
-        elapsed = time.time() - self.last_request_time
-        if elapsed < self.rate_limit_delay:
-            time.sleep(self.rate_limit_delay - elapsed)
-        self.last_request_time = time.time()
+        self.rate_limiter.wait()
         
-    def get_channel_feed(self, results: int = 100) -> Optional[Dict]:
+    def get_channel_feed(self, results: int = 100, start: Optional[datetime] = None,
+                         min_entry_id: Optional[int] = None) -> Optional[Dict]:
         """
         Get channel feed with latest sensor readings
         
         Args:
             results: Number of results to retrieve (max 8000)
+            start: Only request entries created at or after this UTC time
+            min_entry_id: Drop entries with a lower entry_id. ThingSpeak has no
+                entry ID filter, so this is applied client-side; combine with
+                start to limit what is downloaded.
             
         Returns:
             Dictionary containing channel data and feeds
         """
+        data, _ = self._fetch_feed(results, start, min_entry_id)
+        return data
+        
+    def _fetch_feed(self, results: int, start: Optional[datetime] = None,
+                    min_entry_id: Optional[int] = None) -> Tuple[Optional[Dict], Optional[int]]:
+        """
+        Request the channel feed, also returning the HTTP status of a failure
+        
+        The status is returned rather than stored on the client, because
+        clients are shared between threads.
+        
+        Returns:
+            Tuple of (feed data or None, HTTP status of the failed request
+            such as 404 for a missing channel, or None if it succeeded or got
+            no response)
+        """
         self._rate_limit()
         
         url = f"{self.BASE_URL}/channels/{self.channel_id}/feeds.json"
-        params = {"results": results}
+        params = self._feed_params(results, start)
         
-        if self.api_key:
-            params["api_key"] = self.api_key
-            
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
             response.raise_for_status()
-            data = response.json()
+            data = _decode_json(response)
+            if min_entry_id is not None:
+                data['feeds'] = [feed for feed in data.get('feeds', [])
+                                 if feed.get('entry_id', 0) >= min_entry_id]
             logger.info(f"Successfully fetched {len(data.get('feeds', []))} records from channel {self.channel_id}")
-            return data
+            return data, None
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"Error fetching channel feed: {e}")
+            response = getattr(e, 'response', None)
+            return None, response.status_code if response is not None else None
+            
+    def iter_channel_feed(self, results: int = 100, start: Optional[datetime] = None,
+                          min_entry_id: Optional[int] = None) -> Optional[Iterator[Dict]]:
+        """
+        Stream feed entries as the response body arrives
+        
+        With ijson installed, entries are parsed incrementally so callers can
+        start storing them before the download finishes, and memory stays
+        bounded by the caller's batch size. Without it, the body is decoded
+        in full and its entries are yielded.
+        
+        Args:
+            results: Number of results to retrieve (max 8000)
+            start: Only request entries created at or after this UTC time
+            min_entry_id: Drop entries with a lower entry_id
+            
+        Returns:
+            Iterator of feed entries, or None if the request failed. Errors
+            while reading the body are raised from the iterator.
+        """
+        self._rate_limit()
+        
+        url = f"{self.BASE_URL}/channels/{self.channel_id}/feeds.json"
+        params = self._feed_params(results, start)
+        
+        try:
+            response = self.session.get(url, params=params, timeout=10, stream=True)
+            response.raise_for_status()
         except requests.exceptions.RequestException as e:
             logger.error(f"Error fetching channel feed: {e}")
             return None
             
+        logger.info(f"Streaming feed from channel {self.channel_id}")
+        return self._iter_feed_entries(response, min_entry_id)
+        
+    @staticmethod
+    def _iter_feed_entries(response: requests.Response, min_entry_id: Optional[int]) -> Iterator[Dict]:
+        """Yield feed entries from a streamed response, closing it when done"""
+        with response:
+            if ijson:
+                # Let urllib3 undo gzip transfer encoding on the raw stream
+                response.raw.decode_content = True
+                feeds = ijson.items(response.raw, 'feeds.item', use_float=True)
+            else:
+                feeds = _decode_json(response).get('feeds', [])
+            for feed in feeds:
+                if min_entry_id is None or feed.get('entry_id', 0) >= min_entry_id:
+                    yield feed
+                    
+    def _feed_params(self, results: int, start: Optional[datetime]) -> Dict:
+        """Build query parameters for a feed request"""
+        params = {"results": min(results, MAX_FEED_RESULTS)}
+        
+        if start:
+            params["start"] = start.strftime('%Y-%m-%d %H:%M:%S')
+        
+        if self.api_key:
+            params["api_key"] = self.api_key
+        
+        return params
+        
     def get_last_entry(self) -> Optional[Dict]:
         """
         Get the most recent entry from the channel
@@ -81,15 +353,34 @@ class ThingSpeakClient:
             params["api_key"] = self.api_key
             
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
             response.raise_for_status()
-            data = response.json()
+            data = _decode_json(response)
             logger.info(f"Successfully fetched last entry from channel {self.channel_id}")
             return data
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             logger.error(f"Error fetching last entry: {e}")
             return None
             
+    def get_channel_with_last_entry(self) -> Tuple[Optional[Dict], Optional[Dict], Optional[int]]:
+        """
+        Get channel information and its most recent entry in one request
+        
+        The feed endpoint includes the channel object, so asking it for a
+        single result replaces separate channel info and last entry calls.
+        
+        Returns:
+            Tuple of (channel information, latest sensor reading, HTTP status
+            if the request failed); either of the first two is None if
+            unavailable
+        """
+        data, error_status = self._fetch_feed(results=1)
+        if not data:
+            return None, None, error_status
+        
+        feeds = data.get('feeds') or []
+        return data.get('channel'), feeds[-1] if feeds else None, None
+        
     def get_field_data(self, field_number: int, results: int = 100) -> Optional[List[Dict]]:
         """
         Get data for a specific field
@@ -110,13 +401,13 @@ class ThingSpeakClient:
             params["api_key"] = self.api_key
             
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
             response.raise_for_status()
-            data = response.json()
+            data = _decode_json(response)
             feeds = data.get('feeds', [])
             logger.info(f"Successfully fetched {len(feeds)} records for field {field_number}")
             return feeds
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             logger.error(f"Error fetching field data: {e}")
             return None
             
@@ -136,11 +427,11 @@ class ThingSpeakClient:
             params["api_key"] = self.api_key
             
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
             response.raise_for_status()
-            data = response.json()
+            data = _decode_json(response)
             logger.info(f"Successfully fetched channel info for {self.channel_id}")
             return data
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             logger.error(f"Error fetching channel info: {e}")
             return None
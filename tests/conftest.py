@@ -0,0 +1,98 @@
+"""
+Shared fixtures: fake pyodbc connections so database code runs without a server
+"""
+import os
+import sys
+import types
+
+import pytest
+
+# Add src and tools to path
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+
+import database
+
+
+class FakeOdbcError(Exception):
+    """Stands in for pyodbc.Error"""
+
+
+class FakeCursor:
+    """Cursor recording executed SQL, failing on statements containing fail_on
+
+    It does not model pending result sets, so it cannot detect a cursor
+    left holding undrained results ("Connection is busy with results for
+    another command"); tests check that nextset() is called instead.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = -1
+        self.description = None
+        self.fast_executemany = False
+        self.closed = False
+
+    def execute(self, sql, *params):
+        self.connection.log.append(('execute', sql, params))
+        if self.connection.fail_on and self.connection.fail_on in sql:
+            raise FakeOdbcError(f"failed: {self.connection.fail_on}")
+
+    def executemany(self, sql, rows):
+        self.connection.log.append(('executemany', sql, list(rows)))
+        if self.connection.fail_on and self.connection.fail_on in sql:
+            raise FakeOdbcError(f"failed: {self.connection.fail_on}")
+
+    def fetchone(self):
+        return self.connection.fetchone_result
+
+    def fetchall(self):
+        return []
+
+    def nextset(self):
+        self.connection.log.append('nextset')
+        return False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    """pyodbc connection recording commits and rollbacks in log"""
+
+    def __init__(self, fail_on=None):
+        self.log = []
+        self.fail_on = fail_on
+        # Row returned by fetchone(), e.g. a procedure's inserted count
+        self.fetchone_result = (0,)
+        self.cursors = []
+
+    def cursor(self):
+        cursor = FakeCursor(self)
+        self.cursors.append(cursor)
+        return cursor
+
+    def commit(self):
+        self.log.append('commit')
+
+    def rollback(self):
+        self.log.append('rollback')
+
+    def close(self):
+        self.log.append('close')
+
+
+@pytest.fixture
+def fake_pyodbc(monkeypatch):
+    """Make database.py catch FakeOdbcError as pyodbc.Error"""
+    monkeypatch.setattr(database, 'pyodbc', types.SimpleNamespace(Error=FakeOdbcError))
+    return FakeOdbcError
+
+
+@pytest.fixture
+def db(fake_pyodbc):
+    """DatabaseConnection wired to a FakeConnection"""
+    db_connection = database.DatabaseConnection(server='localhost', database='IoTSensorDB')
+    db_connection.connection = FakeConnection()
+    return db_connection
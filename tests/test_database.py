@@ -0,0 +1,244 @@
+"""
+Unit tests for database.py against fake pyodbc connections
+"""
+import io
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import database
+from conftest import FakeConnection
+
+CHANNEL = {'id': 9, 'name': 'Weather Station', 'field1': 'Temperature'}
+
+
+def make_feeds(count):
+    return [{'entry_id': i, 'created_at': '2024-01-01T12:00:00Z', 'field1': str(i)}
+            for i in range(1, count + 1)]
+
+
+def commits_and_rollbacks(connection):
+    return [entry for entry in connection.log if entry in ('commit', 'rollback')]
+
+
+def executed_sql(connection):
+    return [entry[1] for entry in connection.log if isinstance(entry, tuple)]
+
+
+def test_transaction_commits_once(db):
+    with db.transaction():
+        assert db.upsert_channel(CHANNEL)
+        db.insert_sensor_readings(9, make_feeds(3))
+
+    statements = executed_sql(db.connection)
+    assert len(statements) == 2
+    assert 'MERGE iot.Channels' in statements[0]
+    assert 'MERGE iot.SensorReadings' in statements[1]
+    assert commits_and_rollbacks(db.connection) == ['commit']
+
+
+def test_failed_operation_rolls_back_whole_transaction(db, fake_pyodbc):
+    db.connection.fail_on = 'iot.SensorReadings'
+
+    with pytest.raises(fake_pyodbc):
+        with db.transaction():
+            assert db.upsert_channel(CHANNEL)
+            db.insert_sensor_readings(9, make_feeds(3))
+
+    assert commits_and_rollbacks(db.connection) == ['rollback']
+    assert not db._defer_commit
+
+
+def test_failed_operation_outside_transaction_rolls_back_itself(db):
+    db.connection.fail_on = 'iot.SensorReadings'
+
+    assert db.insert_sensor_readings(9, make_feeds(3)) == 0
+    assert commits_and_rollbacks(db.connection) == ['rollback']
+
+
+def test_read_only_transaction_skips_commit(db):
+    with db.transaction():
+        db.get_last_entries([9])
+
+    assert commits_and_rollbacks(db.connection) == []
+
+
+def test_only_full_chunk_statements_keep_cursors(db):
+    full_chunk = database.MAX_PARAMETERS_PER_STATEMENT // 15
+
+    rows = db._iter_reading_rows(9, make_feeds(full_chunk * 2 + 5))
+    db._merge_reading_rows(rows)
+
+    assert len(executed_sql(db.connection)) == 3
+    assert len(db._cursors) == 1
+    throwaway = [cursor for cursor in db.connection.cursors
+                 if cursor not in db._cursors.values()]
+    assert len(throwaway) == 1 and throwaway[0].closed
+
+
+@pytest.fixture
+def pool(monkeypatch, fake_pyodbc):
+    """Pool whose connections are FakeConnections"""
+    def connect(self):
+        self.connection = FakeConnection()
+        return True
+    monkeypatch.setattr(database.DatabaseConnection, 'connect', connect)
+
+    db_pool = database.DatabasePool(size=2, server='localhost', database='IoTSensorDB')
+    assert db_pool.open()
+    yield db_pool
+    db_pool.close()
+
+
+def test_pool_opens_connections_lazily(pool):
+    assert len(pool._connections) == 1
+
+    with pool.acquire():
+        pass
+    with pool.acquire():
+        pass
+
+    # Sequential callers reuse the idle connection
+    assert len(pool._connections) == 1
+
+
+def test_pool_never_exceeds_size(pool):
+    acquired = threading.Event()
+
+    def borrow():
+        with pool.acquire():
+            acquired.set()
+
+    with pool.acquire() as first, pool.acquire() as second:
+        assert first is not second
+        assert len(pool._connections) == 2
+
+        waiter = threading.Thread(target=borrow)
+        waiter.start()
+        # Both connections are in use, so the third caller has to wait
+        assert not acquired.wait(timeout=0.2)
+
+    waiter.join(timeout=5)
+    assert acquired.is_set()
+    assert len(pool._connections) == 2
+
+
+def test_large_batches_load_through_staging(db):
+    db.connection.fetchone_result = (1200,)
+
+    assert db.insert_sensor_readings(9, make_feeds(db.bulk_threshold + 200)) == 1200
+
+    operations = [entry for entry in db.connection.log if isinstance(entry, tuple)]
+    assert operations[0][1] == f"DELETE FROM {db.staging_table} WHERE ChannelID = ?"
+    assert 'usp_MergeStaging' in operations[-1][1]
+    staged = operations[1:-1]
+    assert all(operation == 'executemany' and f"INSERT INTO {db.staging_table}" in sql
+               for operation, sql, _ in staged)
+    assert sum(len(rows) for _, _, rows in staged) == db.bulk_threshold + 200
+    assert commits_and_rollbacks(db.connection) == ['commit']
+
+
+def test_unsized_feeds_load_through_staging_in_chunks(db):
+    db.fast_executemany = False
+    chunk_rows = database.MAX_PARAMETERS_PER_STATEMENT // 15
+    feeds = (feed for feed in make_feeds(chunk_rows + 1))
+
+    db.insert_sensor_readings(9, feeds)
+
+    inserts = [sql for sql in executed_sql(db.connection) if sql.lstrip().startswith('INSERT')]
+    assert len(inserts) == 2
+    assert any('usp_MergeStaging' in sql for sql in executed_sql(db.connection))
+
+
+def test_bcp_command_cancels_on_first_rejected_row(db):
+    db.trust_server_certificate = True
+
+    command = db._bcp_command('/usr/bin/bcp', 'readings.dat', 'readings.err')
+
+    assert command[:4] == ['/usr/bin/bcp', db.staging_table, 'in', 'readings.dat']
+    assert command[command.index('-m') + 1] == '1'
+    assert command[command.index('-e') + 1] == 'readings.err'
+    assert '-T' in command and '-u' in command
+
+
+def test_write_bcp_rows_formats_fields():
+    data_file = io.StringIO()
+    row = (9, 1, '2024-01-01T12:00:00Z', 1e-05, float('nan'), float('inf'), None, 'a\tb')
+
+    database.DatabaseConnection._write_bcp_rows(data_file, [row])
+
+    assert data_file.getvalue() == '9\t1\t2024-01-01 12:00:00\t0.00001\t\t\t\ta b\n'
+
+
+@pytest.fixture
+def bcp(monkeypatch, db):
+    """Fake bcp run; set returncode or rejected to make the copy fail"""
+    run = SimpleNamespace(returncode=0, rejected=False, commands=[])
+
+    def fake_run(command, **kwargs):
+        run.commands.append(command)
+        if run.rejected:
+            with open(command[command.index('-e') + 1], 'w') as error_file:
+                error_file.write('row 1: invalid character value\n')
+        return SimpleNamespace(returncode=run.returncode, stdout='', stderr='')
+
+    monkeypatch.setattr(database.shutil, 'which', lambda name: '/usr/bin/bcp')
+    monkeypatch.setattr(database.subprocess, 'run', fake_run)
+    db.trusted_connection = True
+    db.connection.fetchone_result = (3,)
+    return run
+
+
+def test_bulk_insert_moves_staged_rows(db, bcp):
+    assert db.bulk_insert_sensor_readings(9, make_feeds(3)) == 3
+
+    assert len(bcp.commands) == 1
+    assert any('usp_MergeStaging' in sql for sql in executed_sql(db.connection))
+    assert commits_and_rollbacks(db.connection) == ['commit']
+
+
+@pytest.mark.parametrize('returncode, rejected', [(1, False), (0, True)])
+def test_bulk_insert_falls_back_when_bcp_fails(db, bcp, monkeypatch, returncode, rejected):
+    bcp.returncode, bcp.rejected = returncode, rejected
+    fallback = []
+    monkeypatch.setattr(db, 'insert_sensor_readings',
+                        lambda channel_id, feeds: fallback.append(feeds) or len(feeds))
+
+    assert db.bulk_insert_sensor_readings(9, make_feeds(3)) == 3
+
+    assert len(fallback) == 1
+    assert not any('usp_MergeStaging' in sql for sql in executed_sql(db.connection))
+
+
+def test_ingest_passes_named_table_valued_parameter(db):
+    db.ingest_channel_batch(9, make_feeds(2), run_aggregations=False)
+
+    channel_id, tvp, run_aggregations = db.connection.log[0][2][0]
+    assert (channel_id, run_aggregations) == (9, False)
+    assert tvp[:2] == ['SensorReadingTVP', 'iot']
+    # Rows omit ChannelID, which is passed separately
+    assert [row[:2] for row in tvp[2:]] == [(1, '2024-01-01T12:00:00Z'), (2, '2024-01-01T12:00:00Z')]
+
+
+def test_procedure_results_are_drained(db):
+    db.connection.fetchone_result = (3,)
+
+    assert db.ingest_channel_batch(9, make_feeds(3)) == 3
+    assert db._move_staged_readings(9) == 3
+
+    # A cached cursor left with pending results keeps the connection busy;
+    # FakeCursor cannot model that, so check that each call drains
+    calls = [entry if isinstance(entry, str) else entry[0] for entry in db.connection.log]
+    assert calls == ['execute', 'nextset', 'commit', 'execute', 'nextset']
+
+
+@pytest.mark.parametrize('fail_on', [None, 'usp_CheckDataQuality'])
+def test_stored_procedure_batch_closes_its_cursor(db, fail_on):
+    db.connection.fail_on = fail_on
+
+    db.call_stored_procedures_batch([('iot.usp_AggregateHourly', (9,)),
+                                     ('iot.usp_CheckDataQuality', (9,))])
+
+    assert len(db.connection.cursors) == 1
+    assert db.connection.cursors[0].closed
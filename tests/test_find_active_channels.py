@@ -0,0 +1,76 @@
+"""
+Unit tests for the AIMD concurrency limit in tools/find_active_channels.py
+"""
+import threading
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('requests')
+
+from find_active_channels import AdaptiveConcurrency
+
+
+def response(seconds, retried=False):
+    """Minimal stand-in for a requests response as seen by the response hook"""
+    history = ('429',) if retried else ()
+    return SimpleNamespace(elapsed=timedelta(seconds=seconds),
+                           raw=SimpleNamespace(retries=SimpleNamespace(history=history)))
+
+
+def test_limit_grows_additively_up_to_maximum():
+    concurrency = AdaptiveConcurrency(initial=2, maximum=4, target_latency=1.0)
+
+    concurrency.record(response(0.2))
+    assert concurrency.limit == 2.5
+
+    for _ in range(10):
+        concurrency.record(response(0.2))
+    assert concurrency.limit == 4
+
+
+def test_limit_halves_on_retried_response():
+    concurrency = AdaptiveConcurrency(initial=4, target_latency=1.0)
+
+    concurrency.record(response(0.2, retried=True))
+    assert concurrency.limit == 2
+
+
+def test_retried_response_does_not_feed_latency_average():
+    concurrency = AdaptiveConcurrency(initial=2, target_latency=1.0)
+    concurrency.record(response(0.2))
+
+    # Elapsed time of a retried response includes backoff sleeps
+    concurrency.record(response(30.0, retried=True))
+    assert concurrency.avg_latency == pytest.approx(0.2)
+    assert concurrency.limit == 1.25
+
+    # The next fast response grows the limit again instead of halving it
+    concurrency.record(response(0.2))
+    assert concurrency.limit == 1.75
+
+
+def test_limit_halves_on_slow_responses_but_not_below_one():
+    concurrency = AdaptiveConcurrency(initial=4, target_latency=1.0)
+
+    for _ in range(5):
+        concurrency.record(response(3.0))
+    assert concurrency.limit == 1
+
+
+def test_slot_blocks_beyond_limit():
+    concurrency = AdaptiveConcurrency(initial=1)
+    entered = threading.Event()
+
+    def request():
+        with concurrency.slot():
+            entered.set()
+
+    with concurrency.slot():
+        waiter = threading.Thread(target=request)
+        waiter.start()
+        assert not entered.wait(timeout=0.2)
+
+    waiter.join(timeout=5)
+    assert entered.is_set()
@@ -0,0 +1,102 @@
+"""
+Unit tests for the read-ahead producer thread in pipeline.py
+"""
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('requests')
+
+from pipeline import _read_ahead
+
+
+def test_read_ahead_preserves_order():
+    items = list(range(2500))
+
+    assert list(_read_ahead(iter(items), batch_size=100, max_batches=2)) == items
+
+
+def test_read_ahead_handles_empty_input():
+    assert list(_read_ahead(iter([]))) == []
+
+
+def test_read_ahead_reraises_producer_errors():
+    def feed():
+        yield from range(5)
+        raise ValueError("stream interrupted")
+
+    received = []
+    with pytest.raises(ValueError, match="stream interrupted"):
+        for item in _read_ahead(feed(), batch_size=2):
+            received.append(item)
+
+    # Complete batches read before the error are still delivered, in order
+    assert received == [0, 1, 2, 3]
+
+
+def test_read_ahead_reads_ahead_of_consumer():
+    produced = []
+
+    def feed():
+        for item in range(6):
+            produced.append(item)
+            yield item
+
+    iterator = _read_ahead(feed(), batch_size=2, max_batches=2)
+    assert next(iterator) == 0
+
+    # The producer buffers further batches while the consumer is busy
+    deadline = time.monotonic() + 5
+    while len(produced) < 6 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(produced) == 6
+    assert list(iterator) == [1, 2, 3, 4, 5]
+
+
+def wait_for_producer_exit(threads_before):
+    # The producer polls the stop flag at least every 0.5 s
+    deadline = time.monotonic() + 5
+    while threading.active_count() > threads_before and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return threading.active_count() == threads_before
+
+
+def test_read_ahead_stops_producer_when_abandoned():
+    def endless():
+        item = 0
+        while True:
+            yield item
+            item += 1
+
+    threads_before = threading.active_count()
+    iterator = _read_ahead(endless(), batch_size=10, max_batches=1)
+    assert next(iterator) == 0
+    iterator.close()
+
+    assert wait_for_producer_exit(threads_before)
+
+
+def test_read_ahead_stops_producer_blocked_on_end_marker():
+    threads_before = threading.active_count()
+    # The second batch fills the queue, so the end marker cannot be queued
+    iterator = _read_ahead(iter(range(20)), batch_size=10, max_batches=1)
+    assert next(iterator) == 0
+    time.sleep(0.1)
+    iterator.close()
+
+    assert wait_for_producer_exit(threads_before)
+
+
+def test_read_ahead_stops_producer_blocked_on_error():
+    def feed():
+        yield from range(20)
+        raise ValueError("stream interrupted")
+
+    threads_before = threading.active_count()
+    iterator = _read_ahead(feed(), batch_size=10, max_batches=1)
+    assert next(iterator) == 0
+    time.sleep(0.1)
+    iterator.close()
+
+    assert wait_for_producer_exit(threads_before)
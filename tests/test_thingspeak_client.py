@@ -0,0 +1,77 @@
+"""
+Unit tests for the shared token-bucket RateLimiter, the channel metadata
+cache and feed error reporting in thingspeak_client.py
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+requests = pytest.importorskip('requests')
+
+from thingspeak_client import ChannelMetadataCache, RateLimiter, ThingSpeakClient
+
+
+def timed_waits(limiter, count):
+    start = time.monotonic()
+    for _ in range(count):
+        limiter.wait()
+    return time.monotonic() - start
+
+
+def test_burst_passes_without_waiting():
+    limiter = RateLimiter(min_interval=0.2, burst=3)
+
+    assert timed_waits(limiter, 3) < 0.1
+
+
+def test_sustained_requests_are_paced():
+    limiter = RateLimiter(min_interval=0.05, burst=2)
+
+    # Two burst tokens, then one request per interval
+    elapsed = timed_waits(limiter, 8)
+    assert 6 * 0.05 - 0.02 <= elapsed < 6 * 0.05 + 0.2
+
+
+def test_pacing_is_shared_across_threads():
+    limiter = RateLimiter(min_interval=0.05, burst=1)
+    threads = [threading.Thread(target=timed_waits, args=(limiter, 3)) for _ in range(3)]
+
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    # Nine requests through one bucket: one immediate, eight paced
+    assert 8 * 0.05 - 0.02 <= elapsed < 8 * 0.05 + 0.3
+
+
+def test_zero_interval_disables_limiting():
+    limiter = RateLimiter(min_interval=0)
+
+    assert timed_waits(limiter, 100) < 0.05
+
+
+def test_expired_metadata_is_still_available_for_comparison(tmp_path):
+    cache = ChannelMetadataCache(path=str(tmp_path / 'channel_meta.json'), ttl_seconds=0)
+    metadata = {'id': 9, 'name': 'Weather Station'}
+    cache.set(9, metadata)
+
+    assert cache.get(9) is None
+    assert cache.get(9, include_expired=True) == metadata
+
+
+def test_failed_feed_request_returns_its_status():
+    response = requests.Response()
+    response.status_code = 404
+
+    def get(url, **kwargs):
+        raise requests.exceptions.HTTPError("404 Client Error", response=response)
+
+    client = ThingSpeakClient(channel_id='9', rate_limit_delay=0,
+                              session=SimpleNamespace(get=get))
+
+    assert client.get_channel_with_last_entry() == (None, None, 404)
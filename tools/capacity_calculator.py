@@ -9,7 +9,10 @@ def calculate_capacity(
     schedule_interval_minutes=60,
     processing_overhead_seconds=2.0,
     records_per_channel=100,
-    storage_limit_gb=None
+    storage_limit_gb=None,
+    request_latency_seconds=0.05,
+    requests_per_channel=1,
+    workers=1
 ):
     """
     Calculate maximum channel capacity
@@ -20,26 +23,39 @@ def calculate_capacity(
         processing_overhead_seconds: Database/processing time per channel
         records_per_channel: Records fetched per run
         storage_limit_gb: Database storage limit (None = unlimited)
+        request_latency_seconds: Round-trip time per request. ~0.05s over a
+            kept-alive connection; ~0.2s when each request opens a new TLS connection
+        requests_per_channel: API requests per channel per run. 1 (feed only)
+            while channel metadata is cached; 2 when metadata is refetched
+        workers: Channels processed concurrently (MultiChannelPipeline fetch
+            workers). The shared API rate limit still applies across workers.
     """
     print("="*70)
     print("ThingSpeak Channel Capacity Calculator")
     print("="*70)
     
     # API Constraints
-    requests_per_channel = 2  # metadata + feed data
-    api_time_per_channel = requests_per_channel / api_requests_per_second
+    # Each request waits for the rate limit or its own round-trip, whichever is longer
+    time_per_request = max(1.0 / api_requests_per_second, request_latency_seconds)
+    api_time_per_channel = requests_per_channel * time_per_request
     total_time_per_channel = api_time_per_channel + processing_overhead_seconds
+    # Workers overlap latency and processing, but not the account-wide rate limit
+    effective_time_per_channel = max(requests_per_channel / api_requests_per_second,
+                                     total_time_per_channel / workers)
     
     print(f"\n📡 API Configuration:")
     print(f"  Requests per second: {api_requests_per_second}")
     print(f"  Requests per channel: {requests_per_channel}")
+    print(f"  Request latency: {request_latency_seconds:.2f}s")
     print(f"  API time per channel: {api_time_per_channel:.1f}s")
     print(f"  Processing overhead: {processing_overhead_seconds:.1f}s")
     print(f"  Total time per channel: {total_time_per_channel:.1f}s")
+    print(f"  Concurrent workers: {workers}")
+    print(f"  Effective time per channel: {effective_time_per_channel:.2f}s")
     
     # Time Constraints
     available_time_seconds = schedule_interval_minutes * 60
-    max_channels_by_time = int(available_time_seconds / total_time_per_channel)
+    max_channels_by_time = int(available_time_seconds / effective_time_per_channel)
     
     print(f"\n⏱️  Time Constraints:")
     print(f"  Schedule interval: {schedule_interval_minutes} minutes")
@@ -85,7 +101,7 @@ def calculate_capacity(
     
     for interval, description in scenarios:
         available = interval * 60
-        max_ch = int(available / total_time_per_channel)
+        max_ch = int(available / effective_time_per_channel)
         recommended_ch = int(max_ch * safe_margin)
         print(f"  {description:20s}: {recommended_ch:4d} channels (max: {max_ch})")
     
@@ -98,6 +114,60 @@ def calculate_capacity(
     }
 
 
+def capacity_grid(
+    api_rates,
+    intervals_min,
+    overheads,
+    requests_per_channel=1,
+    request_latency_seconds=0.05,
+    workers=1
+):
+    """
+    Calculate time-bound channel capacity for every combination of inputs
+    
+    Uses the same model as calculate_capacity, broadcast over a
+    (api_rate x interval x overhead) cube in one NumPy pass.
+    
+    Args:
+        api_rates: API rate limits in requests per second
+        intervals_min: Schedule intervals in minutes
+        overheads: Database/processing times per channel in seconds
+        requests_per_channel: API requests per channel per run
+        request_latency_seconds: Round-trip time per request
+        workers: Channels processed concurrently
+        
+    Returns:
+        Integer array of shape (len(api_rates), len(intervals_min), len(overheads))
+        holding the maximum channel count for each combination
+    """
+    import numpy as np
+    
+    rates = np.asarray(api_rates, dtype=float)[:, None, None]
+    intervals = np.asarray(intervals_min, dtype=float)[None, :, None]
+    overheads = np.asarray(overheads, dtype=float)[None, None, :]
+    
+    time_per_request = np.maximum(1.0 / rates, request_latency_seconds)
+    total_time_per_channel = requests_per_channel * time_per_request + overheads
+    effective_time_per_channel = np.maximum(requests_per_channel / rates,
+                                            total_time_per_channel / workers)
+    return (intervals * 60 / effective_time_per_channel).astype(int)
+
+
+def print_capacity_grid(api_rates, intervals_min, overheads, **kwargs):
+    """Print capacity_grid as one interval x overhead table per API rate"""
+    grid = capacity_grid(api_rates, intervals_min, overheads, **kwargs)
+    
+    print("="*70)
+    print("Max Channels by Time (rows: schedule interval, columns: overhead)")
+    print("="*70)
+    for i, rate in enumerate(api_rates):
+        print(f"\n📡 API rate: {rate} requests/second")
+        print(f"  {'interval':>10s} " + "".join(f"{overhead:>8.1f}s" for overhead in overheads))
+        for j, interval in enumerate(intervals_min):
+            print(f"  {interval:>6d} min " + "".join(f"{count:>9d}" for count in grid[i, j]))
+    print("="*70)
+
+
 def main():
     print("\n" + "="*70)
     print("Scenario 1: Free Tier, Hourly Pipeline")
@@ -106,6 +176,7 @@ def main():
         api_requests_per_second=1.0,
         schedule_interval_minutes=60,
         processing_overhead_seconds=2.0,
+        workers=8,
         storage_limit_gb=10  # 10 GB database
     )
     
@@ -116,6 +187,7 @@ def main():
         api_requests_per_second=3.0,
         schedule_interval_minutes=15,
         processing_overhead_seconds=2.0,
+        workers=8,
         storage_limit_gb=50  # 50 GB database
     )
     
@@ -126,9 +198,18 @@ def main():
         api_requests_per_second=1.0,
         schedule_interval_minutes=1440,  # 24 hours
         processing_overhead_seconds=2.0,
+        workers=8,
         storage_limit_gb=100  # 100 GB database
     )
     
+    print("\n")
+    print_capacity_grid(
+        api_rates=[1.0, 2.0, 3.0, 4.0],
+        intervals_min=[5, 15, 60, 1440],
+        overheads=[0.5, 1.0, 2.0, 5.0],
+        workers=8
+    )
+    
     print("\n\n" + "="*70)
     print("Custom Scenario")
     print("="*70)
@@ -136,6 +217,7 @@ def main():
     print("  - api_requests_per_second: 1.0 (free) or 3-4 (paid)")
     print("  - schedule_interval_minutes: How often you run the pipeline")
     print("  - processing_overhead_seconds: Database write time (~2s typical)")
+    print("  - workers: Channels processed concurrently (fetch workers)")
     print("  - storage_limit_gb: Your database storage limit")
     print("="*70)
 
@@ -5,15 +5,26 @@ Tests a list of known public channel IDs
 """
 import sys
 import os
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache
 from datetime import datetime, timezone
 
+try:
+    import ciso8601
+except ImportError:  # Fall back to datetime.fromisoformat
+    ciso8601 = None
+
 # Add src to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from thingspeak_client import ThingSpeakClient
+from thingspeak_client import (ThingSpeakClient, ChannelMetadataCache, RateLimiter,
+                               create_session, FIELD_KEYS)
 
 # List of known public ThingSpeak channels
-KNOWN_CHANNELS = [
+KNOWN_CHANNELS = (
     9,        # Home weather station
     12397,    # MathWorks Weather Station
     38629,    # Temperature monitoring
@@ -29,22 +40,124 @@ KNOWN_CHANNELS = [
     1976416,  # Sensor data
     140612,   # Weather
     266256,   # Temperature
-]
+)
 
-def check_channel(channel_id):
-    """Check if a channel is active and accessible"""
-    try:
-        client = ThingSpeakClient(channel_id=str(channel_id), rate_limit_delay=0.5)
+# Section separator for the report
+SEP = "=" * 70
+
+# Channels are probed concurrently; each check is dominated by network latency.
+# This is the most checks ever in flight; AdaptiveConcurrency picks the actual limit.
+MAX_WORKERS = 8
+
+# One keep-alive session for every check, so TLS is negotiated once per connection.
+# Rate-limited (429) and 5xx responses are retried with backoff rather than
+# reporting a live channel as not accessible.
+SESSION = create_session(pool_maxsize=MAX_WORKERS, retries=5, backoff_factor=1.0)
+
+# Requests from all workers share one budget of about 3 per second
+RATE_LIMITER = RateLimiter(min_interval=1 / 3, burst=3)
+
+# Responses reused by later runs: channel info rarely changes, last entries do
+INFO_CACHE = ChannelMetadataCache('.cache/channel_info.json', ttl_seconds=24 * 3600)
+LAST_ENTRY_CACHE = ChannelMetadataCache('.cache/channel_last_entry.json', ttl_seconds=3600)
+# Channels the API answered 404 for, skipped without a request until the entry expires
+MISSING_CACHE = ChannelMetadataCache('.cache/channel_missing.json', ttl_seconds=24 * 3600)
+
+class AdaptiveConcurrency:
+    """AIMD limit on the number of channel requests in flight
+    
+    The limit grows additively while the average server round-trip stays
+    under the target, and halves as soon as it exceeds it or a response only
+    arrived after retries (429 or 5xx). A retried response's elapsed time
+    includes urllib3's backoff and Retry-After sleeps, so only responses
+    that succeeded on the first attempt feed the latency average.
+    """
+    
+    def __init__(self, initial: int = 2, maximum: int = MAX_WORKERS,
+                 target_latency: float = 1.0):
+        """
+        Initialize the limiter
         
-        # Get channel info
-        info = client.get_channel_info()
-        if not info:
-            return None
+        Args:
+            initial: Requests allowed in flight at first
+            maximum: Upper bound for the limit
+            target_latency: Average round-trip seconds above which to back off
+        """
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.avg_latency = None
+        self._in_flight = 0
+        self._condition = threading.Condition()
         
-        # Get last entry to check activity
-        last_entry = client.get_last_entry()
-        if not last_entry:
-            return None
+    @contextmanager
+    def slot(self):
+        """Hold one in-flight slot for the duration of a request"""
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                self._condition.wait()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+                
+    def record(self, response, *args, **kwargs):
+        """Adjust the limit from a response (a requests response hook)"""
+        latency = response.elapsed.total_seconds()
+        retries = getattr(response.raw, 'retries', None)
+        throttled = bool(retries and retries.history)
+        with self._condition:
+            if not throttled:
+                if self.avg_latency is None:
+                    self.avg_latency = latency
+                else:
+                    self.avg_latency = 0.8 * self.avg_latency + 0.2 * latency
+            if throttled or self.avg_latency >= self.target_latency:
+                self.limit = max(self.limit * 0.5, 1.0)
+            else:
+                self.limit = min(self.limit + 0.5, self.maximum)
+            self._condition.notify_all()
+
+CONCURRENCY = AdaptiveConcurrency()
+SESSION.hooks['response'].append(CONCURRENCY.record)
+
+def _parse_timestamp(created_at):
+    """Parse a ThingSpeak UTC timestamp such as 2024-01-01T12:00:00Z"""
+    if ciso8601:
+        return ciso8601.parse_datetime(created_at)
+    return datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+
+@lru_cache(maxsize=128)
+def _client(channel_id):
+    """Get the client for a channel, sharing the module session and rate limiter"""
+    return ThingSpeakClient(channel_id=channel_id, rate_limiter=RATE_LIMITER, session=SESSION)
+
+def check_channel(channel_id, now_utc=None):
+    """Check if a channel is active and accessible, measuring age from now_utc"""
+    if now_utc is None:
+        now_utc = datetime.now(timezone.utc)
+    if MISSING_CACHE.get(channel_id):
+        return None
+    
+    try:
+        # Get channel info and last entry (to check activity), fetching both
+        # in a single request when either is not cached
+        info = INFO_CACHE.get(channel_id)
+        last_entry = LAST_ENTRY_CACHE.get(channel_id)
+        if not info or not last_entry:
+            client = _client(channel_id)
+            with CONCURRENCY.slot():
+                info, last_entry, error_status = client.get_channel_with_last_entry()
+            if not info or not last_entry:
+                # Only a 404 is remembered; other failures are retried next run
+                if error_status == 404:
+                    MISSING_CACHE.set(channel_id, {'status': 404})
+                return None
+            INFO_CACHE.set(channel_id, info)
+            LAST_ENTRY_CACHE.set(channel_id, last_entry)
         
         # Parse timestamp
         created_at = last_entry.get('created_at')
@@ -52,11 +165,11 @@ def check_channel(channel_id):
             return None
         
         # Check how recent
-        last_update = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-        age_hours = (datetime.now(timezone.utc) - last_update).total_seconds() / 3600
+        last_update = _parse_timestamp(created_at)
+        age_hours = (now_utc - last_update).total_seconds() / 3600
         
         # Count fields
-        field_count = sum(1 for i in range(1, 9) if info.get(f'field{i}'))
+        field_count = sum(1 for key in FIELD_KEYS if info.get(key))
         
         return {
             'channel_id': channel_id,
@@ -74,46 +187,59 @@ def check_channel(channel_id):
         return None
 
 def main():
-    print("="*70)
+    print(SEP)
     print("Searching for Active Public ThingSpeak Channels")
-    print("="*70)
+    print(SEP)
     
     active_channels = []
     inactive_channels = []
     
-    for channel_id in KNOWN_CHANNELS:
-        print(f"\nChecking channel {channel_id}...", end=" ")
-        result = check_channel(channel_id)
+    print(f"\nChecking {len(KNOWN_CHANNELS)} channels...")
+    # One reference time, so channel ages are comparable however checks interleave
+    now_utc = datetime.now(timezone.utc)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(check_channel, channel_id, now_utc): channel_id
+                   for channel_id in KNOWN_CHANNELS}
         
-        if result:
-            if result['active']:
-                print(f"✅ ACTIVE")
-                print(f"  Name: {result['name']}")
-                print(f"  Last update: {result['age_hours']:.1f} hours ago")
-                print(f"  Fields: {result['fields']}")
-                active_channels.append(result)
+        # Report each channel as soon as its check finishes
+        for future in as_completed(futures):
+            channel_id = futures[future]
+            result = future.result()
+            print(f"\nChannel {channel_id}:", end=" ")
+            
+            if result:
+                if result['active']:
+                    print(f"✅ ACTIVE")
+                    print(f"  Name: {result['name']}")
+                    print(f"  Last update: {result['age_hours']:.1f} hours ago")
+                    print(f"  Fields: {result['fields']}")
+                    active_channels.append(result)
+                else:
+                    print(f"⚠️  INACTIVE ({result['age_hours']:.0f} hours ago)")
+                    inactive_channels.append(result)
             else:
-                print(f"⚠️  INACTIVE ({result['age_hours']:.0f} hours ago)")
-                inactive_channels.append(result)
-        else:
-            print("❌ NOT ACCESSIBLE")
+                print("❌ NOT ACCESSIBLE")
+    
+    SESSION.close()
+    INFO_CACHE.save()
+    LAST_ENTRY_CACHE.save()
+    MISSING_CACHE.save()
     
     # Print summary
-    print("\n" + "="*70)
+    print("\n" + SEP)
     print("Summary")
-    print("="*70)
+    print(SEP)
     print(f"Active channels (< 7 days): {len(active_channels)}")
     print(f"Inactive channels: {len(inactive_channels)}")
     print(f"Not accessible: {len(KNOWN_CHANNELS) - len(active_channels) - len(inactive_channels)}")
     
     if active_channels:
-        print("\n" + "="*70)
+        print("\n" + SEP)
         print("Top 10 Active Channels (by recency)")
-        print("="*70)
+        print(SEP)
         
-        # Sort by most recent
-        active_channels.sort(key=lambda x: x['age_hours'])
-        top_10 = active_channels[:10]
+        # Most recent first, without sorting the channels that are not shown
+        top_10 = heapq.nsmallest(10, active_channels, key=lambda x: x['age_hours'])
         
         print("\nChannel IDs for .env configuration:")
         print("THINGSPEAK_CHANNEL_IDS=" + ",".join(str(ch['channel_id']) for ch in top_10))
@@ -129,7 +255,7 @@ def main():
         print("\n⚠️  No active channels found. Using default channels:")
         print("THINGSPEAK_CHANNEL_IDS=9,12397")
     
-    print("\n" + "="*70)
+    print("\n" + SEP)
 
 if __name__ == "__main__":
     main()